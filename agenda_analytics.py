@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+
+# numpy is only needed for the columnar export and its analytics, pip install numpy
+import numpy as np
+
+# sqlite wrapper class
+from db_table import db_table
+
+# to convert the agenda dates and times
+from schedule_index import parse_date, parse_time
+
+# python module for constants
+import agenda_constants as constants
+
+# for method typing
+from typing import Dict, List, Tuple
+
+# to grab command line arguments
+import sys
+
+import os
+
+"""
+This module exports the sessions and sessions_speakers tables as columnar NumPy arrays, and computes capacity
+planning aggregates on them with vectorized operations.
+
+Every column is saved as <table>.<column>.npy. Text columns are dictionary-encoded: <table>.<column>.npy holds an
+integer code per row and <table>.<column>.values.npy the distinct values the codes point to. Missing numbers are -1.
+The arrays can be memory-mapped, so aggregates only page in the columns they read.
+
+Run it on an exported directory to print the aggregates:
+    agenda_analytics.py columns/ [rooms|speakers|fanout]
+"""
+
+# aggregates printed by the command line
+ANALYTICS_REPORTS = ('rooms', 'speakers', 'fanout')
+
+HOURS_PER_DAY = 24
+
+
+def dictionary_encode(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Encodes text values as integer codes into their sorted distinct values.
+
+    Returns
+        (the code of every value, the distinct values)
+    """
+
+    distinct_values, codes = np.unique(np.array(values, dtype=str), return_inverse=True)
+
+    return (codes.astype(np.int32), distinct_values)
+
+
+def to_int_array(values: List, dtype) -> np.ndarray:
+    """
+    Converts numbers to an array, None becomes -1
+    """
+
+    return np.array([-1 if value is None else value for value in values], dtype=dtype)
+
+
+def export_columns(sessions: db_table, directory: str) -> None:
+    """
+    Writes the sessions and their speakers as columnar arrays.
+
+    Parameters
+    ------------
+    sessions: db_table
+        the sessions table of the database to export, the other tables are read over its connection
+    directory: str
+        the directory to write the arrays in, created if it does not exist
+    """
+
+    os.makedirs(directory, exist_ok=True)
+
+    session_rows = sessions.select(['session_id', 'parent_session_id', 'subtree_end', 'date', 'time_start', 'time_end', 'location'],
+                                   order_by='session_id')
+
+    speaker_rows = sessions.select_query(
+        "SELECT ss.session_id, sp.speaker_name FROM %s AS ss JOIN %s AS sp ON sp.speaker_id = ss.speaker_id ORDER BY ss.session_id" % (
+            constants.SESSIONS_SPEAKERS_TABLE_NAME, constants.SPEAKERS_TABLE_NAME))
+
+    # top level sessions store their missing parent as text
+    parent_session_ids = [row['parent_session_id'] if isinstance(row['parent_session_id'], int) else None for row in session_rows]
+
+    columns = {
+        'sessions.session_id': to_int_array([row['session_id'] for row in session_rows], np.int32),
+        'sessions.parent_session_id': to_int_array(parent_session_ids, np.int32),
+        'sessions.subtree_end': to_int_array([row['subtree_end'] for row in session_rows], np.int32),
+        'sessions.day': to_int_array([parse_date(row['date']) for row in session_rows], np.int32),
+        'sessions.start_minute': to_int_array([parse_time(row['time_start']) for row in session_rows], np.int16),
+        'sessions.end_minute': to_int_array([parse_time(row['time_end']) for row in session_rows], np.int16),
+        'sessions_speakers.session_id': to_int_array([row['session_id'] for row in speaker_rows], np.int32)
+    }
+
+    columns['sessions.location'], columns['sessions.location.values'] = dictionary_encode([row['location'] for row in session_rows])
+    columns['sessions_speakers.speaker'], columns['sessions_speakers.speaker.values'] = dictionary_encode(
+        [row['speaker_name'] for row in speaker_rows])
+
+    for name, array in columns.items():
+        np.save(os.path.join(directory, name + ".npy"), array)
+
+
+def load_columns(directory: str) -> Dict[str, np.ndarray]:
+    """
+    Memory-maps the arrays written by export_columns.
+
+    Returns
+        a dictionary mapping <table>.<column> to its array
+    """
+
+    columns = dict()
+
+    for filename in os.listdir(directory):
+        if filename.endswith(".npy"):
+            columns[filename[:-len(".npy")]] = np.load(os.path.join(directory, filename), mmap_mode='r')
+
+    return columns
+
+
+def sessions_per_room_hour(columns: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Counts the sessions taking place in each room during each hour of the day, over every day of the agenda.
+    A session is counted in every hour it overlaps. Sessions without a room or without valid times are left out.
+
+    Returns
+        (the rooms, a rooms x 24 array of session counts)
+    """
+
+    locations = columns['sessions.location.values']
+    location_codes = columns['sessions.location']
+    start_minutes = columns['sessions.start_minute'].astype(np.int32)
+    end_minutes = columns['sessions.end_minute'].astype(np.int32)
+
+    # dates and times that could not be parsed are -1, leave them out before they look like a session past midnight
+    valid = (columns['sessions.day'] >= 0) & (start_minutes >= 0) & (end_minutes >= 0)
+
+    # sessions running past midnight are counted until midnight
+    end_minutes = np.where(valid & (end_minutes < start_minutes), HOURS_PER_DAY * 60, end_minutes)
+
+    scheduled = (locations != "")[location_codes] & valid & (end_minutes > start_minutes)
+
+    first_hours = start_minutes[scheduled] // 60
+    num_hours = (end_minutes[scheduled] - 1) // 60 - first_hours + 1
+    session_locations = location_codes[scheduled]
+
+    # one entry per (session, hour it overlaps): repeat each session once per hour and count up from its first hour
+    hour_offsets = np.arange(num_hours.sum()) - np.repeat(np.cumsum(num_hours) - num_hours, num_hours)
+    hours = np.repeat(first_hours, num_hours) + hour_offsets
+    hour_locations = np.repeat(session_locations, num_hours)
+
+    counts = np.bincount(hour_locations * HOURS_PER_DAY + hours, minlength=len(locations) * HOURS_PER_DAY)
+    counts = counts.reshape(len(locations), HOURS_PER_DAY)
+
+    rooms = locations != ""
+
+    return (locations[rooms], counts[rooms])
+
+
+def speaker_load(columns: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Counts the sessions of every speaker.
+
+    Returns
+        (the speakers, their number of sessions, how many speakers have 0, 1, 2, ... sessions)
+    """
+
+    speakers = columns['sessions_speakers.speaker.values']
+    loads = np.bincount(columns['sessions_speakers.speaker'], minlength=len(speakers))
+
+    return (speakers, loads, np.bincount(loads))
+
+
+def subsession_fanout(columns: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Counts the subsessions of every top level session, the range (session_id, subtree_end] of the session tree.
+
+    Returns
+        (the top level session ids, their number of subsessions, how many sessions have 0, 1, 2, ... subsessions)
+    """
+
+    top_level = columns['sessions.parent_session_id'] < 0
+    session_ids = columns['sessions.session_id'][top_level]
+    fanout = columns['sessions.subtree_end'][top_level] - session_ids
+
+    return (session_ids, fanout, np.bincount(fanout))
+
+
+def print_room_hours(rooms: np.ndarray, counts: np.ndarray) -> None:
+    """
+    Prints the sessions per room per hour, only the hours in which some room is used
+    """
+
+    used_hours = np.flatnonzero(counts.sum(axis=0))
+
+    print('{:<25}'.format('Room'), " ".join(['{:>3}'.format(hour) for hour in used_hours]))
+    print("=" * (26 + 4 * len(used_hours)))
+
+    for room, room_counts in zip(rooms, counts):
+        print('{:<25}'.format(room[:25]), " ".join(['{:>3}'.format(count) for count in room_counts[used_hours]]))
+
+    print()
+
+
+def print_distribution(label: str, distribution: np.ndarray) -> None:
+    """
+    Prints how many speakers or sessions have each count
+    """
+
+    print('{:<15}{}'.format(label, 'Count'))
+    print("=" * 25)
+
+    for value in np.flatnonzero(distribution):
+        print('{:<15}{}'.format(value, distribution[value]))
+
+    print()
+
+
+def main():
+    if len(sys.argv) not in (2, 3) or (len(sys.argv) == 3 and sys.argv[2] not in ANALYTICS_REPORTS):
+        raise TypeError("Please provide your report request in the following format: [columns directory] [rooms|speakers|fanout]")
+
+    columns = load_columns(sys.argv[1])
+    reports = ANALYTICS_REPORTS if len(sys.argv) == 2 else (sys.argv[2],)
+
+    if 'rooms' in reports:
+        print_room_hours(*sessions_per_room_hour(columns))
+
+    if 'speakers' in reports:
+        speakers, loads, distribution = speaker_load(columns)
+        print_distribution('Sessions', distribution)
+
+    if 'fanout' in reports:
+        session_ids, fanout, distribution = subsession_fanout(columns)
+        print_distribution('Subsessions', distribution)
+
+
+
+if __name__ == "__main__":
+    main()
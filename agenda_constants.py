@@ -6,17 +6,94 @@ This python module contains values that are used by lookup_agenda.py, test_looku
 
 # table column names
 SESSIONS_COLS = ('session_id', 'parent_session_id','title', 'location', 'description', 'session_type')
+
+# columns printed by lookup_agenda.py, the description is replaced by its precomputed summary
+SESSIONS_DISPLAY_COLS = ('session_id', 'parent_session_id', 'title', 'location', 'description_summary', 'session_type')
 SESSIONS_SPEAKERS_COLS = ('session_id', 'speaker_id')
 SPEAKERS_COLS = ('speaker_id', 'speaker_name')
+IMPORT_METADATA_COLS = ('meta_key', 'meta_value')
+SUGGESTIONS_COLS = ('kind', 'suggestion_key', 'suggestion', 'session_count')
 
 # table names
 SESSIONS_TABLE_NAME = "sessions"
 SESSIONS_SPEAKERS_TABLE_NAME = "sessions_speakers"
 SPEAKERS_TABLE_NAME = "speakers"
+IMPORT_METADATA_TABLE_NAME = "import_metadata"
+SUGGESTIONS_TABLE_NAME = "suggestions"
+
+# import_metadata key of the counter bumped by every import
+IMPORT_GENERATION_KEY = "import_generation"
+
+# import_metadata key of the unique id of every import
+IMPORT_ID_KEY = "import_id"
+
+# width of the description column printed by lookup_agenda.py, summaries are shortened to it at import
+DESCRIPTION_DISPLAY_WIDTH = 45
+
+# number of sessions whose full description is read per query by lookup_agenda.py --json / --detail
+DESCRIPTION_CHUNK_SIZE = 500
+
+# formats of the date and time columns of the agenda
+AGENDA_DATE_FORMAT = "%m/%d/%Y"
+AGENDA_TIME_FORMAT = "%I:%M %p"
+
+# rows to skip before reading in the data of an agenda spreadsheet, the header is the last row skipped
+NUM_SKIP_ROWS = 15
+
+# headers of the agenda spreadsheet columns, lowercased without their * and repeated whitespace
+AGENDA_HEADERS = ('date', 'time start', 'time end', 'session or sub-session', 'session title', 'room/location', 'description', 'speakers')
+
+# values of the session or sub-session column
+AGENDA_SESSION_TYPES = ('Session', 'Sub')
+
+# stages of the import of each row, timed by import_agenda.py --dry-run
+IMPORT_STAGES = ('read', 'sanitize', 'structure')
 
 # valid lookup columns for lookup_agenda.py
 LOOKUP_COLS = ('date', 'time_start', 'time_end', 'title', 'location', 'description', 'speaker')
 
+# operators joining the column=value predicates of a compound lookup
+COMPOUND_OPERATORS = ('AND', 'OR')
+
+# columns lookup_agenda.py suggest can complete
+SUGGEST_COLS = ('speaker', 'title', 'location')
+
+# number of completions printed by lookup_agenda.py suggest without a --limit
+DEFAULT_SUGGESTIONS = 10
+
+# completions of prefixes up to this length are ranked once when the prefix index is loaded
+PRECOMPUTED_PREFIX_LENGTH = 2
+
+# kinds of schedule conflicts reported by lookup_agenda.py conflicts
+CONFLICT_KINDS = ('room', 'speaker')
+
+# rows per page when lookup_agenda.py is given a --after cursor without a --limit
+DEFAULT_PAGE_SIZE = 50
+
+# maximum number of lookup results kept by the lookup_agenda.py query cache
+QUERY_CACHE_SIZE = 256
+
+# number of threads, each with its own database connection, that run async_lookup_agenda.py lookups
+ASYNC_LOOKUP_WORKERS = 8
+
+# maximum number of event databases searched at the same time by a lookup_agenda.py --shard lookup
+SHARD_LOOKUP_WORKERS = 8
+
+# number of SQLite virtual machine instructions between checks for a cancelled async lookup
+CANCEL_CHECK_INSTRUCTIONS = 1000
+
+# statements run by db_table taking at least this many milliseconds are logged with their query plan by --profile
+SLOW_QUERY_MS = 10
+
+# slow query log written by lookup_agenda.py --profile
+SLOW_QUERY_LOG_NAME = "slow_queries.log"
+
+# latest durations of each query shape kept to compute its 99th percentile
+PROFILE_SAMPLES = 1000
+
+# number of query shapes printed by a profiling report
+PROFILE_REPORT_SIZE = 10
+
 
 # descriptions to test for test_lookup_agenda.py
 test_descriptions = [
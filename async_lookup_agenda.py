@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+# event loop integration
+import asyncio
+
+# bounded pool of worker threads that run the blocking queries
+from concurrent.futures import ThreadPoolExecutor
+
+# each worker thread keeps its own database connection
+import threading
+
+# for method typing
+from typing import Dict, List, Optional, Tuple
+
+# sqlite wrapper class
+from db_table import db_table
+
+# the blocking lookup functions and the query cache
+import lookup_agenda as lookup
+import agenda_constants as constants
+
+"""
+This module exposes the lookups of lookup_agenda.py to asyncio applications.
+Queries run on a bounded pool of threads so a slow lookup never stalls the event loop,
+and lookups can be awaited concurrently, cancelled or given a timeout.
+"""
+
+
+class LookupCancellation():
+    """
+    Tracks whether the caller awaiting a lookup has given up on it.
+    The worker thread checks the flag through a SQLite progress handler so that a cancelled
+    or timed out lookup stops running its queries instead of holding on to the worker.
+    """
+
+    def __init__(self) -> None:
+        self.cancelled = False
+
+    def is_cancelled(self) -> int:
+        """
+        SQLite progress handler, a non zero return value aborts the running statement
+        """
+        return 1 if self.cancelled else 0
+
+
+class AsyncAgendaLookup():
+    """
+    asyncio facade over lookup_agenda.py. Every worker thread of the pool lazily opens its own
+    connection to the database, which is reused by every lookup that runs on that thread until the
+    database is re-imported.
+
+    Example:
+        async with AsyncAgendaLookup() as agenda:
+            result = await agenda.lookup("speaker", "Shan Lu", timeout=1.0)
+    """
+
+    def __init__(self, max_workers: int = constants.ASYNC_LOOKUP_WORKERS, db_name: Optional[str] = None) -> None:
+        """
+        Parameters
+        ------------
+        max_workers: int
+            the number of lookups that can run at the same time
+        db_name: Optional[str]
+            the event database to look up, db_table.DB_NAME by default
+        """
+
+        self.db_name = db_name if db_name else db_table.DB_NAME
+
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="agenda-lookup")
+        self.thread_state = threading.local()
+
+        # every connection opened by the worker threads, closed along with the pool
+        self.connections = []
+        self.connections_lock = threading.Lock()
+
+    def get_thread_tables(self) -> Dict[str, db_table]:
+        """
+        Returns the tables of the calling worker thread, connecting to the database on first use.
+        A re-import replaces the database file, so the thread reconnects once the import id has changed
+        """
+
+        tables = getattr(self.thread_state, "tables", None)
+        import_id = lookup.query_cache.get_import_id(self.db_name)
+
+        if tables is not None and self.thread_state.import_id != import_id:
+            # the connection still reads the database file the re-import replaced
+            old_conn = tables[constants.SESSIONS_TABLE_NAME].db_conn
+
+            with self.connections_lock:
+                self.connections.remove(old_conn)
+
+            old_conn.close()
+            tables = None
+
+        if tables is None:
+            # the connection is only used by this thread, but is closed by the thread that shuts the pool down
+            db_conn = db_table.connect(self.db_name, check_same_thread=False)
+            tables = lookup.connect_tables(db_conn, self.db_name)
+
+            self.thread_state.tables = tables
+            self.thread_state.import_id = import_id
+
+            with self.connections_lock:
+                self.connections.append(db_conn)
+
+        return tables
+
+    def run_lookup(self, lookup_dict: Dict[str,str], cancellation: LookupCancellation) -> List[Dict[str,str]]:
+        """
+        Runs a blocking lookup on a worker thread
+
+        Parameters
+        ------------
+        lookup_dict: Dict[str,str]
+            dictionary containing the lookup column and the sanitized value to search for
+        cancellation: LookupCancellation
+            set by the event loop if the lookup is no longer awaited
+
+        Returns
+            a list of dictionaries containing the matching sessions and their subsessions
+        """
+
+        # nobody is waiting for the result anymore
+        if cancellation.cancelled:
+            return []
+
+        tables = self.get_thread_tables()
+        db_conn = tables[constants.SESSIONS_TABLE_NAME].db_conn
+
+        # abort the queries of this lookup as soon as the caller stops waiting for it
+        db_conn.set_progress_handler(cancellation.is_cancelled, constants.CANCEL_CHECK_INSTRUCTIONS)
+
+        try:
+            return lookup.cached_lookup(lookup_dict, tables)
+        finally:
+            db_conn.set_progress_handler(None, 0)
+
+    async def lookup(self, column: str, value: str, timeout: Optional[float] = None) -> List[Dict[str,str]]:
+        """
+        Looks up the sessions where column matches value without blocking the event loop.
+
+        Parameters
+        ------------
+        column: str
+            one of the lookup columns in agenda_constants.LOOKUP_COLS
+        value: str
+            the value to search for, sanitized the same way as lookup_agenda.py command line values
+        timeout: Optional[float]
+            seconds to wait for the result before raising asyncio.TimeoutError. Waits forever if None
+
+        Returns
+            a list of dictionaries containing the matching sessions and their subsessions
+        """
+
+        # if the user inputs a wrong column name
+        if(column not in constants.LOOKUP_COLS):
+            raise ValueError("{} is not a valid lookup column.".format(column))
+
+        lookup_dict = {column: lookup.sanitize_string(value)}
+        cancellation = LookupCancellation()
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, self.run_lookup, lookup_dict, cancellation)
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            cancellation.cancelled = True
+            raise
+
+    async def lookup_many(self, queries: List[Tuple[str, str]], timeout: Optional[float] = None) -> List[List[Dict[str,str]]]:
+        """
+        Runs several lookups concurrently.
+
+        Parameters
+        ------------
+        queries: List[Tuple[str, str]]
+            (column, value) pairs to look up
+        timeout: Optional[float]
+            seconds to wait for each lookup
+
+        Returns
+            the result of each lookup, in the order of queries
+        """
+
+        return await asyncio.gather(*[self.lookup(column, value, timeout) for column, value in queries])
+
+    def close(self) -> None:
+        """
+        Waits for the running lookups to finish and closes every worker connection
+        """
+
+        self.executor.shutdown(wait=True)
+
+        with self.connections_lock:
+            for db_conn in self.connections:
+                db_conn.close()
+
+            self.connections = []
+
+    async def __aenter__(self) -> "AsyncAgendaLookup":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        # do not block the event loop while the pool drains
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
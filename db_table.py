@@ -3,31 +3,65 @@
 # sqlite db communication
 import sqlite3
 
+# to time statements when profiling
+import time
+
 #
 # Very basic SQLite wrapper
 #
 # Creates table from schema
 # Provides small set of utility functions to query the database
 #
+# Inserts and updates are committed right away, unless autocommit is turned off to group them in one transaction
+#
 # If you need to change the schema of an already created table, reset the database
 # If you need to reset the database, just delete the database file (db_table.DB_NAME)
 #
+# Statements are timed once a profiler, e.g. query_profiler.QueryProfiler, is installed as db_table.profiler
+#
 class db_table:
 
     # SQLite database filename
     DB_NAME = "interview_test.db"
 
+    # profiler every statement is reported to, with its record(db_conn, db_name, query, params, seconds) method
+    # None to run statements without timing them
+    profiler = None
+
+    #
+    # opens a connection to a database
+    #
+    # \param db_name            string  a database file, ":memory:", or a "file:" URI such as "file:agenda?mode=memory&cache=shared"
+    #                                   to share one in-memory database between the connections of a process
+    # \param check_same_thread  bool    False to use the connection from other threads
+    #
+    @staticmethod
+    def connect(db_name, check_same_thread = True):
+        return sqlite3.connect(db_name, uri=db_name.startswith("file:"), check_same_thread=check_same_thread)
+
+    #
+    # tells if a database only lives in memory, it then has no file to stat and goes away with its last connection
+    #
+    @staticmethod
+    def is_in_memory(db_name):
+        return db_name == ":memory:" or (db_name.startswith("file:") and "mode=memory" in db_name)
+
     #
     # model initialization
     # records table name and schema
     # creates the table if it does not exist yet in DB
     #
-    # \param name    string                name of the DB table
-    # \param schema  dict<string, string>  schema of DB table, mapping column name to their DB type & constraint
+    # \param name     string                name of the DB table
+    # \param schema   dict<string, string>  schema of DB table, mapping column name to their DB type & constraint
+    # \param db_conn  sqlite3.Connection    optional connection to share with other tables. if empty, a new connection is opened
+    # \param db_name  string                optional database to connect to, or that db_conn is connected to. if empty, DB_NAME is used
+    #                                       ":memory:" and "file:" URIs are accepted, see connect()
     #
     # Example: table("users", { "id": "integer PRIMARY KEY", "name": "text" })
+    #          table("groups", { "id": "integer PRIMARY KEY" }, users.db_conn)
+    #          table("users", { "id": "integer PRIMARY KEY", "name": "text" }, db_name="event_2018.db")
     #
-    def __init__(self, name, schema):
+    def __init__(self, name, schema, db_conn = None, db_name = None):
         # error handling
         if not name:
             raise RuntimeError("invalid table name")
@@ -37,7 +71,11 @@ class db_table:
         # init fields and initiate database connection
         self.name    = name
         self.schema  = schema
-        self.db_conn = sqlite3.connect(self.DB_NAME)
+        self.db_name = db_name if db_name else self.DB_NAME
+        self.db_conn = db_conn if db_conn else self.connect(self.db_name)
+
+        # commit every insert and update. when False, the caller commits the transaction with commit()
+        self.autocommit = True
 
         # enable foreign keys
         self.db_conn.execute("PRAGMA foreign_keys = ON")
@@ -45,6 +83,31 @@ class db_table:
         # ensure the table is created
         self.create_table()
 
+    #
+    # Run a statement and fetch its rows, reporting the time both took to the profiler if one is installed
+    #
+    # \param query   string         the statement. values are either formatted in or passed as ? placeholders
+    # \param params  array<string>  values bound to the placeholders, in order
+    # \param many    bool           run the statement once for every array of values in params
+    #
+    # \return the cursor, to read its description or lastrowid, and the fetched rows
+    #
+    def execute(self, query, params = [], many = False):
+        start = time.perf_counter()
+
+        if many:
+            cursor = self.db_conn.executemany(query, params)
+        else:
+            cursor = self.db_conn.execute(query, params)
+
+        rows = cursor.fetchall()
+
+        if db_table.profiler is not None:
+            db_table.profiler.record(self.db_conn, self.db_name, query, params[0] if many and params else params,
+                                     time.perf_counter() - start)
+
+        return (cursor, rows)
+
     #
     # CREATE TABLE IF NOT EXISTS wrapper
     # Create the database table based on self.name and self.schema
@@ -61,23 +124,27 @@ class db_table:
         # Note that columns are formatted into the string without using sqlite safe substitution mechanism
         # The reason is that sqlite does not provide substitution mechanism for columns parameters
         # In the context of this project, this is fine (no risk of user malicious input)
-        self.db_conn.execute("CREATE TABLE IF NOT EXISTS %s (%s)" % (self.name, columns_query_string))
+        self.execute("CREATE TABLE IF NOT EXISTS %s (%s)" % (self.name, columns_query_string))
         self.db_conn.commit()
 
     #
     # SELECT wrapper
     # Query the database by applying the specified filters
     #
-    # \param columns  array<string>         columns to be fetched. if empty, will query all the columns
-    # \param where    dict<string, string>  where filters to be applied. only combine them using AND and only check for strict equality
+    # \param columns   array<string>         columns to be fetched. if empty, will query all the columns
+    # \param where     dict<string, string>  where filters to be applied. only combine them using AND and only check for strict equality
+    # \param order_by  string                optional column to sort the rows by, in ascending order
+    # \param after     string                optional keyset cursor. only fetch rows whose order_by column is greater than after
+    # \param limit     int                   optional maximum number of rows to fetch
     #
     # \return [ { col1: val1, col2: val2, col3: val3 } ]
     #
     # Example table.select(["name"], { "id": "42" })
     #         table.select()
     #         table.select(where={ "name": "John" })
+    #         table.select(order_by="id", after="42", limit=50)
     #
-    def select(self, columns = [], where = {}):
+    def select(self, columns = [], where = {}, order_by = None, after = None, limit = None):
         # by default, query all columns
         if not columns:
             columns = [ k for k in self.schema ]
@@ -86,10 +153,21 @@ class db_table:
         columns_query_string = ", ".join(columns)
         query                = "SELECT %s FROM %s" % (columns_query_string, self.name)
         # build where query string
-        if where:
-            where_query_string = [ "%s = '%s'" % (k,v) for k,v in where.items() ]
+        where_query_string = [ "%s = '%s'" % (k,v) for k,v in where.items() ]
+
+        # keyset pagination: seek past the last row of the previous page instead of skipping rows with OFFSET
+        if order_by and after is not None:
+            where_query_string.append("%s > '%s'" % (order_by, after))
+
+        if where_query_string:
             query             += " WHERE " + ' AND '.join(where_query_string)
 
+        if order_by:
+            query += " ORDER BY %s" % order_by
+
+        if limit is not None:
+            query += " LIMIT %d" % limit
+
 
 
         result = []
@@ -99,7 +177,9 @@ class db_table:
         # The reason is that sqlite does not provide substitution mechanism for columns parameters
         # In the context of this project, this is fine (no risk of user malicious input)
 
-        for row in self.db_conn.execute(query):
+        cursor, rows = self.execute(query)
+
+        for row in rows:
             result_row = {}
             # convert from (val1, val2, val3) to { col1: val1, col2: val2, col3: val3 }
             for i in range(0, len(columns)):
@@ -108,6 +188,45 @@ class db_table:
 
         return result
 
+    #
+    # Raw SELECT wrapper
+    # Run a SELECT statement built by the caller, e.g. one joining several tables
+    #
+    # \param query   string         SELECT statement. values are passed as ? placeholders
+    # \param params  array<string>  values bound to the placeholders, in order
+    #
+    # \return [ { col1: val1, col2: val2, col3: val3 } ]
+    #
+    # Example table.select_query("SELECT name FROM users WHERE id = ?", [42])
+    #
+    def select_query(self, query, params = []):
+        cursor, rows = self.execute(query, params)
+        columns      = [ description[0] for description in cursor.description ]
+
+        # convert from (val1, val2, val3) to { col1: val1, col2: val2, col3: val3 }
+        return [ dict(zip(columns, row)) for row in rows ]
+
+    #
+    # CREATE INDEX IF NOT EXISTS wrapper
+    # Index a column of the table, or several columns in order, the index is named idx_<table>_<column>[_<column>...]
+    #
+    # \param column  string or tuple<string>  column to index, or columns of a composite index
+    #
+    # Example table.create_index("name")
+    #         table.create_index(("last_name", "first_name"))
+    #
+    def create_index(self, column):
+        columns = (column,) if isinstance(column, str) else column
+        self.execute("CREATE INDEX IF NOT EXISTS %s ON %s (%s)" % (self.index_name(column), self.name, ", ".join(columns)))
+        self.db_conn.commit()
+
+    #
+    # Name of the index created by create_index for a column or a tuple of columns
+    #
+    def index_name(self, column):
+        columns = (column,) if isinstance(column, str) else column
+        return "idx_%s_%s" % (self.name, "_".join(columns))
+
     #
     # INSERT INTO wrapper
     # insert the given item into database
@@ -131,16 +250,31 @@ class db_table:
         # Note that columns are formatted into the string without using sqlite safe substitution mechanism
         # The reason is that sqlite does not provide substitution mechanism for columns parameters
         # In the context of this project, this is fine (no risk of user malicious input)
-        cursor = self.db_conn.cursor()
-        
         #print("INSERT INTO %s (%s) VALUES (%s)" % (self.name, columns_query, values_query), "\n\n")
 
-        cursor.execute("INSERT INTO %s (%s) VALUES (%s)" % (self.name, columns_query, values_query))
+        cursor, rows = self.execute("INSERT INTO %s (%s) VALUES (%s)" % (self.name, columns_query, values_query))
         
         cursor.close()
-        self.db_conn.commit()
+        if self.autocommit:
+            self.db_conn.commit()
         return cursor.lastrowid
 
+    #
+    # Bulk INSERT INTO wrapper
+    # insert many items with a single prepared statement
+    #
+    # \param columns  array<string>         columns to insert
+    # \param rows     array<array<string>>  values of every item, in the order of columns
+    #
+    # Example table.insert_many(["id", "name"], [[42, "John"], [43, "Simon"]])
+    #
+    def insert_many(self, columns, rows):
+        placeholders = ", ".join([ "?" for column in columns ])
+
+        self.execute("INSERT INTO %s (%s) VALUES (%s)" % (self.name, ", ".join(columns), placeholders), rows, many=True)
+        if self.autocommit:
+            self.db_conn.commit()
+
     #
     # UPDATE wrapper
     # update multiple rows matching the specified condition
@@ -162,14 +296,22 @@ class db_table:
         # Note that columns are formatted into the string without using sqlite safe substitution mechanism
         # The reason is that sqlite does not provide substitution mechanism for columns parameters
         # In the context of this project, this is fine (no risk of user malicious input)
-        cursor = self.db_conn.cursor()
-        cursor.execute("UPDATE %s SET %s WHERE %s" % (self.name, set_query, where_query))
+        cursor, rows = self.execute("UPDATE %s SET %s WHERE %s" % (self.name, set_query, where_query))
         cursor.close()
-        self.db_conn.commit()
+        if self.autocommit:
+            self.db_conn.commit()
         return cursor.rowcount
 
+    #
+    # Commit the current transaction
+    # Only needed when autocommit is turned off
+    #
+    def commit(self):
+        self.db_conn.commit()
+
     #
     # Close the database connection
+    # Tables sharing the connection are closed along with it
     #
     def close(self):
         self.db_conn.close()
@@ -17,21 +17,223 @@ import sys
 # to extract text from an html tag
 from html2text import html2text
 
+# to read the generation of the database being replaced
+from lookup_agenda import get_import_generation
+
+# to precompute the description displayed by lookups
+from lookup_agenda import shorten_string
+
+# to check the dates and times of the agenda
+from schedule_index import session_interval
+
+# to measure the throughput of each import stage
+import time
+
+# to tell imports apart
+import uuid
+
+# to key the suggestions of the type-ahead prefix index
+from prefix_index import suggestion_keys
+
 import os
 
+# to parse several spreadsheets in parallel
+from concurrent.futures import ProcessPoolExecutor
+import tempfile
+
+# for method typing
+from typing import Dict, Iterator, List, Optional, Tuple
+
 """
 This program extracts data from a spreadsheet file and creates a relational database that fits the data format
 of an event spreadsheet passed in from the command line. It then populates the database using the extracted data.
 """
     
-class AgendaToDatabase():
+class AgendaDatabase():
+    """
+    This class handles the tables of an event database. Creating them, indexing them once they are populated
+    and merging in the tables of other event databases.
+    """
+
+    def create_tables(self, database_filename: str = db_table.DB_NAME) -> None:
+        """
+        Creates the tables and provides a connection to the tables.
+        Every table shares the same connection.
+
+        Parameters
+        ------------
+        database_filename: str
+            the database to save the tables in, "interview_test.db" by default. ":memory:" builds the tables in RAM,
+            they can then be saved to disk with backup
+        """
+        # create the tables and inserts them into the database
+        db_conn = db_table.connect(database_filename)
+
+        self.speakers = db_table(constants.SPEAKERS_TABLE_NAME, table_defs.speakers_dict, db_conn, database_filename)
+        self.sessions = db_table(constants.SESSIONS_TABLE_NAME, table_defs.sessions_dict, db_conn, database_filename)
+        self.sessions_speakers = db_table(constants.SESSIONS_SPEAKERS_TABLE_NAME, table_defs.sessions_speakers_dict, db_conn, database_filename)
+        self.import_metadata = db_table(constants.IMPORT_METADATA_TABLE_NAME, table_defs.import_metadata_dict, db_conn, database_filename)
+        self.suggestions = db_table(constants.SUGGESTIONS_TABLE_NAME, table_defs.suggestions_dict, db_conn, database_filename)
+
+
+    def merge_database(self, staging_filename: str) -> None:
+        """
+        Appends the sessions and speakers of another event database to the tables.
+
+        session_id and parent_session_id are shifted past the sessions already in the tables, so every source
+        keeps its sessions contiguous and in order. Speakers are de-duplicated by name, and the sessions_speakers
+        rows are remapped to the speaker_id kept for each name.
+
+        Parameters
+        ------------
+        staging_filename: str
+            the event database to merge, created by AgendaToDatabase
+        """
+        db_conn = self.sessions.db_conn
+        db_conn.execute("ATTACH DATABASE ? AS staging", (staging_filename,))
+
+        session_id_offset = db_conn.execute("SELECT COALESCE(MAX(session_id), 0) FROM %s" % constants.SESSIONS_TABLE_NAME).fetchone()[0]
+
+        # top level sessions store their missing parent as text, only shift the ids of actual parents
+        sessions_columns = [column for column in table_defs.sessions_dict if column not in ('session_id', 'parent_session_id', 'subtree_end')]
+        db_conn.execute(
+            "INSERT INTO {sessions} (session_id, parent_session_id, subtree_end, {columns}) "
+            "SELECT session_id + :offset, "
+            "CASE WHEN typeof(parent_session_id) = 'integer' THEN parent_session_id + :offset ELSE parent_session_id END, "
+            "subtree_end + :offset, {columns} "
+            "FROM staging.{sessions} ORDER BY session_id".format(
+                sessions=constants.SESSIONS_TABLE_NAME, columns=", ".join(sessions_columns)),
+            {'offset': session_id_offset}
+        )
+
+        # speaker_name is UNIQUE, speakers already known from a previous source keep their speaker_id
+        db_conn.execute(
+            "INSERT OR IGNORE INTO {speakers} (speaker_name) SELECT speaker_name FROM staging.{speakers} ORDER BY speaker_id".format(
+                speakers=constants.SPEAKERS_TABLE_NAME)
+        )
+
+        db_conn.execute(
+            "INSERT INTO {sessions_speakers} (session_id, speaker_id) "
+            "SELECT staged.session_id + :offset, merged_speaker.speaker_id FROM staging.{sessions_speakers} AS staged "
+            "JOIN staging.{speakers} AS staged_speaker ON staged_speaker.speaker_id = staged.speaker_id "
+            "JOIN main.{speakers} AS merged_speaker ON merged_speaker.speaker_name = staged_speaker.speaker_name "
+            "ORDER BY staged.rowid".format(
+                sessions_speakers=constants.SESSIONS_SPEAKERS_TABLE_NAME, speakers=constants.SPEAKERS_TABLE_NAME),
+            {'offset': session_id_offset}
+        )
+
+        db_conn.commit()
+        db_conn.execute("DETACH DATABASE staging")
+
+
+    def build_suggestions(self) -> None:
+        """
+        Builds the prefix index lookup_agenda.py suggest completes speaker names, session titles and locations from.
+        Every name is counted once per session it appears in, and keyed once per word it contains.
+        Built once every source is populated or merged, so the counts cover the whole event.
+        """
+        names_queries = {
+            'speaker': "SELECT sp.speaker_name AS name, COUNT(ss.session_id) AS session_count FROM {speakers} AS sp "
+                       "JOIN {sessions_speakers} AS ss ON ss.speaker_id = sp.speaker_id GROUP BY sp.speaker_id",
+            'title': "SELECT title AS name, COUNT(*) AS session_count FROM {sessions} WHERE title != '' GROUP BY title",
+            'location': "SELECT location AS name, COUNT(*) AS session_count FROM {sessions} WHERE location != '' GROUP BY location"
+        }
+
+        suggestion_rows = []
+
+        for kind, names_query in names_queries.items():
+            names = self.sessions.select_query(names_query.format(
+                speakers=constants.SPEAKERS_TABLE_NAME, sessions_speakers=constants.SESSIONS_SPEAKERS_TABLE_NAME,
+                sessions=constants.SESSIONS_TABLE_NAME))
+
+            for row in names:
+                for suggestion_key in suggestion_keys(row['name']):
+                    suggestion_rows.append((kind, suggestion_key, row['name'], row['session_count']))
+
+        # rowid order is key order, so lookups load the index already sorted
+        suggestion_rows.sort()
+
+        self.suggestions.insert_many(constants.SUGGESTIONS_COLS, suggestion_rows)
+
+
+    def create_indexes(self) -> None:
+        """
+        Indexes the columns used by lookups and gathers the statistics the lookup query planner reads.
+        Indexes are created once the tables are populated so that inserts do not have to maintain them.
+        """
+        for column in table_defs.sessions_indexed_cols:
+            self.sessions.create_index(column)
+
+        for column in table_defs.sessions_speakers_indexed_cols:
+            self.sessions_speakers.create_index(column)
+
+        for columns in table_defs.suggestions_indexed_cols:
+            self.suggestions.create_index(columns)
+
+        # store index statistics in sqlite_stat1
+        self.sessions.db_conn.execute("ANALYZE")
+        self.sessions.db_conn.commit()
+
+
+    def record_import_generation(self, generation: int) -> None:
+        """
+        Stores the import generation counter and a unique id of this import, so lookups can tell that cached
+        results are out of date. The generation starts over when the database file was deleted, the id does not.
+
+        Parameters
+        ------------
+        generation: int
+            the generation of this import, one more than the generation of the database it replaces
+        """
+        self.import_metadata.insert({'meta_key': constants.IMPORT_GENERATION_KEY, 'meta_value': generation})
+        self.import_metadata.insert({'meta_key': constants.IMPORT_ID_KEY, 'meta_value': uuid.uuid4().hex})
+
+
+    def backup(self, database_filename: str) -> None:
+        """
+        Copies the whole database to another database with the sqlite3 backup API, in one pass over its pages.
+        The copy replaces any content the target database had, so readers of the target never see a partial import.
+
+        Parameters
+        ------------
+        database_filename: str
+            the database to write, usually the file lookups read when the tables were built in memory
+        """
+        target_conn = db_table.connect(database_filename)
+        self.sessions.db_conn.backup(target_conn)
+        target_conn.close()
+
+
+    def export_columns(self, directory: str) -> None:
+        """
+        Writes the sessions and their speakers as columnar NumPy arrays for agenda_analytics.py. Requires numpy.
+
+        Parameters
+        ------------
+        directory: str
+            the directory to write the arrays in
+        """
+        # numpy is only needed by the export
+        from agenda_analytics import export_columns
+
+        export_columns(self.sessions, directory)
+
+
+    def close(self) -> None:
+        """
+        Closes the connection shared by the tables
+        """
+        self.sessions.close()
+
+
+class AgendaToDatabase(AgendaDatabase):
     """
     This class handles reading in the spreadsheet. Parsing the spreadsheet and populating the database.
     """
 
-    def __init__(self, spreadsheet_file: str, skip_num_rows: int) -> None:
+    def __init__(self, spreadsheet_file: str, skip_num_rows: int, sheet_index: int = 0) -> None:
         """
-        Initializes AgendaToDatabase by grabbing the first sheet of agenda.xls' 
+        Initializes AgendaToDatabase by grabbing a sheet of agenda.xls, the first one by default
 
         Parameters
         ------------
@@ -40,26 +242,18 @@ class AgendaToDatabase():
 
         skip_num_rows: int
             the number of rows to skip to reach the headers in agenda.xls
+
+        sheet_index: int
+            the index of the sheet to read
         """
     
-        # open the spreadsheet and connect to the first sheet
+        # open the spreadsheet and connect to the sheet
         events_workbook = xlrd.open_workbook(spreadsheet_file)
-        self.event_sheet = events_workbook.sheet_by_index(0)
+        self.event_sheet = events_workbook.sheet_by_index(sheet_index)
 
         self.skip_num_rows = skip_num_rows
 
 
-    def create_tables(self) -> None:
-        """
-        Creates the tables and provides a connection to the tables.
-        The tables will be saved in "interview_test.db"
-        """
-        # create the tables and inserts them into the database "interview_test.db"
-        self.speakers = db_table(constants.SPEAKERS_TABLE_NAME, table_defs.speakers_dict)
-        self.sessions = db_table(constants.SESSIONS_TABLE_NAME, table_defs.sessions_dict)
-        self.sessions_speakers = db_table(constants.SESSIONS_SPEAKERS_TABLE_NAME, table_defs.sessions_speakers_dict)
-
-
     def get_cell_value(self, row: int, col: int) -> str:
         """ 
         Wrapper function for cell_value. Access a cell in the agenda.xls sheet.
@@ -113,39 +307,80 @@ class AgendaToDatabase():
         return val
 
 
-    def populate_database(self) -> None:
+    def check_header(self, problems: List[Tuple[int, str, str]]) -> None:
         """
-        Parses data of an agenda spreadsheet file and populates tables in the database
+        Checks that the row just above the first row read is the header of an agenda, so skip_num_rows is right.
+
+        Parameters
+        ------------
+        problems: List[Tuple[int, str, str]]
+            list the problems found are appended to, as (spreadsheet row number, "error", message)
         """
+        header_row = self.skip_num_rows - 1
 
-        # contains every speaker and their corresponding id
-        speakers_dict = dict()
+        if header_row < 0 or header_row >= self.event_sheet.nrows or self.event_sheet.ncols < len(constants.AGENDA_HEADERS):
+            problems.append((header_row + 1, "error", "the agenda header was not found, check the number of rows to skip"))
+            return
+
+        for col, expected_header in enumerate(constants.AGENDA_HEADERS):
+            header = " ".join(str(self.get_cell_value(header_row, col)).replace("*", "").lower().split())
+
+            if not header.startswith(expected_header):
+                problems.append((header_row + 1, "error",
+                                 "column {} is \"{}\" instead of \"{}\", check the number of rows to skip".format(col + 1, header, expected_header)))
+
+
+    def parse_rows(self, problems: List[Tuple[int, str, str]], stage_seconds: Optional[Dict[str, float]] = None) -> Iterator[Tuple[int, Dict[str, str], List[str]]]:
+        """
+        Reads, sanitizes and links the rows of the agenda one at a time, without writing anything.
+        Sessions are numbered in order from 1, the session_id they get in a new database.
+
+        Parameters
+        ------------
+        problems: List[Tuple[int, str, str]]
+            list the problems found are appended to, as (spreadsheet row number, "error" or "warning", message).
+            Errors would break the session tree, warnings are imported as they are
+        stage_seconds: Optional[Dict[str, float]]
+            if given, the seconds spent reading, sanitizing and linking the rows are added to its
+            "read", "sanitize" and "structure" entries
+
+        Returns
+            a generator of (session_id, sessions row without its session_id, sanitized speaker names)
+        """
+        stage_seconds = stage_seconds if stage_seconds is not None else dict()
 
-        # primary key indices to set foreign keys
-        sessions_pk_index = 1
-        parent_session_index = 1
-        speakers_pk_index = 1
+        for stage in constants.IMPORT_STAGES:
+            stage_seconds.setdefault(stage, 0.0)
 
+        # primary key index of the last session read, to link the subsessions that follow it
+        parent_session_index = None
+        parent_session_title = None
 
-        row_index = self.skip_num_rows
+        session_id = 0
 
-        while( row_index < self.event_sheet.nrows):
+        for row_index in range(self.skip_num_rows, self.event_sheet.nrows):
+            row_number = row_index + 1
+            session_id += 1
+
+            stage_start = time.perf_counter()
 
             # each dictionary will be used to create a row in each table
             sessions_row_dict = dict()
-            speakers_dict_row = dict()
-            
+
             sessions_row_dict['date'] = self.get_cell_value(row_index, 0)
             sessions_row_dict['time_start'] = self.get_cell_value(row_index, 1)
             sessions_row_dict['time_end'] = self.get_cell_value(row_index, 2)
             sessions_row_dict['session_type'] = self.get_cell_value(row_index, 3)
-            
-            # clean long texts before inserting
+
             title = self.get_cell_value(row_index, 4)
             location = self.get_cell_value(row_index, 5)
             description = self.get_cell_value(row_index, 6)
             speakers = self.get_cell_value(row_index, 7)
 
+            read_end = time.perf_counter()
+            stage_seconds['read'] += read_end - stage_start
+
+            # clean long texts before inserting
             title = self.sanitize_string(title)
             location = self.sanitize_string(location)
             description = html2text(str(description))
@@ -154,71 +389,420 @@ class AgendaToDatabase():
             sessions_row_dict['title'] = title
             sessions_row_dict['location'] = location
             sessions_row_dict['description'] = description
-            
+            sessions_row_dict['description_summary'] = shorten_string(description, constants.DESCRIPTION_DISPLAY_WIDTH)
+
+            sanitize_end = time.perf_counter()
+            stage_seconds['sanitize'] += sanitize_end - read_end
+
+            if session_interval(sessions_row_dict['date'], sessions_row_dict['time_start'], sessions_row_dict['time_end']) is None:
+                problems.append((row_number, "warning", "the date or times cannot be read, \"{} {} - {}\"".format(
+                    sessions_row_dict['date'], sessions_row_dict['time_start'], sessions_row_dict['time_end'])))
+
+            if not title:
+                problems.append((row_number, "warning", "the session has no title"))
+
+            # every session starts as a leaf of the session tree
+            sessions_row_dict['subtree_end'] = session_id
+
+            if sessions_row_dict['session_type'] not in constants.AGENDA_SESSION_TYPES:
+                problems.append((row_number, "warning", "\"{}\" is neither Session nor Sub, the row is read as a subsession".format(
+                    sessions_row_dict['session_type'])))
 
             if(sessions_row_dict['session_type'] == "Session"):
                 # keep track of the session index in case it has subsessions
-                parent_session_index = sessions_pk_index
+                parent_session_index = session_id
                 parent_session_title = title
                 sessions_row_dict['parent_session_id'] = None
+            elif parent_session_index is None:
+                problems.append((row_number, "error", "the subsession does not follow any session"))
+                sessions_row_dict['parent_session_id'] = None
+                sessions_row_dict['session_type'] = "Subsession"
             else:
                 # refer to the parent session's PK index if the row is a subsession
                 sessions_row_dict['parent_session_id'] = parent_session_index
                 sessions_row_dict['session_type'] = "Subsession of " + parent_session_title
 
+            speaker_names = []
 
             if speakers != "":
-                speakers = speakers.split("; ")
+                for speaker in speakers.split("; "):
+                    speaker_name = self.sanitize_string(speaker)
+
+                    if not speaker_name:
+                        problems.append((row_number, "warning", "the speakers contain an empty name, \"{}\"".format(speakers)))
+                    elif ";" in speaker_name:
+                        problems.append((row_number, "warning", "speakers have to be separated by \"; \", \"{}\"".format(speaker_name)))
+                    elif speaker_name in speaker_names:
+                        problems.append((row_number, "warning", "{} is listed twice".format(speaker_name)))
+
+                    # warnings do not change what is imported
+                    speaker_names.append(speaker_name)
+
+            stage_seconds['structure'] += time.perf_counter() - sanitize_end
+
+            yield (session_id, sessions_row_dict, speaker_names)
+
+
+    def populate_database(self) -> None:
+        """
+        Parses data of an agenda spreadsheet file and populates tables in the database.
+        The tables and the session tree are written in a single transaction, which is only committed if the
+        session tree is valid.
+        """
+
+        # commit once every row is written
+        for table in (self.speakers, self.sessions, self.sessions_speakers):
+            table.autocommit = False
+
+        # contains every speaker and their corresponding id
+        speakers_dict = dict()
+
+        # session_id of the last subsession of every session that has subsessions
+        subtree_ends = dict()
+
+        problems = []
+
+        for session_id, sessions_row_dict, speaker_names in self.parse_rows(problems):
+
+            for speaker_name in speaker_names:
+                if speaker_name not in speakers_dict:
+                    # keep track of new speakers encountered
+                    speakers_dict[speaker_name] = self.speakers.insert({'speaker_name': speaker_name})
+
+                # add the current session_id and speaker_id to the sessions_speakers table
+                self.sessions_speakers.insert({'speaker_id': speakers_dict[speaker_name], 'session_id': session_id})
+
+            self.sessions.insert(sessions_row_dict)
+
+            # subsessions follow their parent, so the last one read closes the parent's subtree
+            if sessions_row_dict['parent_session_id'] is not None:
+                subtree_ends[sessions_row_dict['parent_session_id']] = session_id
+
+        errors = [problem for problem in problems if problem[1] == "error"]
+
+        if errors:
+            self.sessions.db_conn.rollback()
+            raise ValueError("row {}: {}".format(errors[0][0], errors[0][2]))
+
+        # extend the sessions that have subsessions over the range of their subsessions
+        for parent_session_id, subtree_end in subtree_ends.items():
+            self.sessions.update({'subtree_end': subtree_end}, {'session_id': parent_session_id})
+
+        self.sessions.commit()
+
+        for table in (self.speakers, self.sessions, self.sessions_speakers):
+            table.autocommit = True
+
+
+def validate_agenda(source: Tuple[str, int], skip_num_rows: int) -> Dict:
+    """
+    Runs the whole parse and sanitize pipeline of a sheet without writing a database, streaming its rows.
+
+    Parameters
+    ------------
+    source: Tuple[str, int]
+        the spreadsheet filename and the index of the sheet to validate
+    skip_num_rows: int
+        the number of rows to skip to reach the headers of the sheet
+
+    Returns
+        a dictionary with the number of rows read, the problems found as (row number, severity, message), and the
+        seconds spent opening the sheet and in each import stage
+    """
+    spreadsheet_file, sheet_index = source
+
+    open_start = time.perf_counter()
+    agenda_to_database = AgendaToDatabase(spreadsheet_file, skip_num_rows, sheet_index)
+    open_seconds = time.perf_counter() - open_start
+
+    problems = []
+    stage_seconds = dict()
+
+    agenda_to_database.check_header(problems)
+
+    num_rows = 0
+
+    for parsed_row in agenda_to_database.parse_rows(problems, stage_seconds):
+        num_rows += 1
+
+    return {
+        'source': source,
+        'num_rows': num_rows,
+        'problems': problems,
+        'open_seconds': open_seconds,
+        'stage_seconds': stage_seconds
+    }
+
+
+def print_validation_report(report: Dict) -> None:
+    """
+    Prints the problems found in a sheet, and the rows per second of each import stage
+    """
+    spreadsheet_file, sheet_index = report['source']
+    num_errors = len([problem for problem in report['problems'] if problem[1] == "error"])
+
+    print("{} (sheet {}): {} rows, {} errors, {} warnings".format(
+        spreadsheet_file, sheet_index, report['num_rows'], num_errors, len(report['problems']) - num_errors))
+
+    for row_number, severity, message in report['problems']:
+        print("    row {}: {}: {}".format(row_number, severity, message))
+
+    print()
+    print('    {:<12}{:>12}{:>14}'.format('Stage', 'Seconds', 'Rows/sec'))
+
+    print('    {:<12}{:>12.4f}'.format('open', report['open_seconds']))
+
+    total_seconds = 0.0
+
+    for stage in constants.IMPORT_STAGES:
+        seconds = report['stage_seconds'][stage]
+        total_seconds += seconds
+
+        print('    {:<12}{:>12.4f}{:>14}'.format(stage, seconds, rows_per_second(report['num_rows'], seconds)))
 
-                for speaker in speakers:
-                    sessions_speaker_dict_row = dict()
+    print('    {:<12}{:>12.4f}{:>14}'.format('total', total_seconds, rows_per_second(report['num_rows'], total_seconds)))
+    print()
 
-                    if speaker not in speakers_dict.keys():
 
-                        # keep track of new speakers encountered
-                        speakers_dict[speaker] = speakers_pk_index
+def rows_per_second(num_rows: int, seconds: float) -> str:
+    """
+    Formats a throughput, "-" when nothing was timed
+    """
+    return "{:.0f}".format(num_rows / seconds) if seconds > 0 else "-"
 
-                        speakers_dict_row['speaker_name'] = self.sanitize_string(speaker)
-                        speakers_pk_index = self.speakers.insert(speakers_dict_row) + 1
 
-                    # add the current session_id and speaker_id to the sessions_speakers table
-                    sessions_speaker_dict_row['speaker_id'] = speakers_dict[speaker]
-                    sessions_speaker_dict_row['session_id'] = sessions_pk_index
-                    self.sessions_speakers.insert(sessions_speaker_dict_row)
-                    
-            
-            sessions_pk_index = self.sessions.insert(sessions_row_dict) + 1
+def list_sources(spreadsheet_files: List[str], all_sheets: bool) -> List[Tuple[str, int]]:
+    """
+    Lists the sheets to import.
+
+    Parameters
+    ------------
+    spreadsheet_files: List[str]
+        the spreadsheets to import, in order
+    all_sheets: bool
+        import every sheet of each spreadsheet instead of only the first one
+
+    Returns
+        (spreadsheet filename, sheet index) of every sheet to import, in order
+    """
+    sources = []
+
+    for spreadsheet_file in spreadsheet_files:
+        num_sheets = 1
 
+        if all_sheets:
+            # only read the sheet names, the worker processes load the sheets themselves
+            num_sheets = xlrd.open_workbook(spreadsheet_file, on_demand=True).nsheets
+
+        sources += [(spreadsheet_file, sheet_index) for sheet_index in range(num_sheets)]
+
+    return sources
+
+
+def import_to_staging(source: Tuple[str, int], skip_num_rows: int, staging_filename: str) -> str:
+    """
+    Parses one sheet into its own staging database. Runs in a worker process.
+
+    Parameters
+    ------------
+    source: Tuple[str, int]
+        the spreadsheet filename and the index of the sheet to import
+    skip_num_rows: int
+        the number of rows to skip to reach the headers of the sheet
+    staging_filename: str
+        the staging database to create
+
+    Returns
+        staging_filename
+    """
+    spreadsheet_file, sheet_index = source
 
-            row_index += 1
+    agenda_to_database = AgendaToDatabase(spreadsheet_file, skip_num_rows, sheet_index)
+    agenda_to_database.create_tables(staging_filename)
+    agenda_to_database.populate_database()
+    agenda_to_database.close()
+
+    return staging_filename
+
+
+def import_in_parallel(sources: List[Tuple[str, int]], skip_num_rows: int, database: AgendaDatabase, workers: int) -> None:
+    """
+    Parses every sheet in its own worker process and merges them into the database.
+    Sheets are merged in the order of sources as soon as they are parsed, so session ids do not depend on
+    which worker finishes first.
+
+    Parameters
+    ------------
+    sources: List[Tuple[str, int]]
+        (spreadsheet filename, sheet index) of every sheet to import, in order
+    skip_num_rows: int
+        the number of rows to skip to reach the headers of each sheet
+    database: AgendaDatabase
+        the database to merge the sheets into, its tables have to be created
+    workers: int
+        the maximum number of worker processes
+    """
+    with tempfile.TemporaryDirectory() as staging_dir:
+        staging_filenames = [os.path.join(staging_dir, "staging_{}.db".format(index)) for index in range(len(sources))]
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(sources))) as executor:
+            staged = executor.map(import_to_staging, sources, [skip_num_rows] * len(sources), staging_filenames)
+
+            for staging_filename in staged:
+                database.merge_database(staging_filename)
+
+
+def parse_command_line(cmdline: List[str]) -> Tuple[List[str], bool, int, str, bool, Optional[str], bool]:
+    """
+    Parses the command line of import_agenda.py
+        import_agenda.py agenda.xls [more.xls ...] [--all-sheets] [--workers N] [--db PATH] [--in-memory] [--export-columns DIR] [--dry-run]
+
+    Parameters
+    ------------
+    cmdline: List[str]
+        the commandline arguments
+
+    Returns
+        (spreadsheet filenames, import every sheet, number of worker processes, database filename,
+        build the database in memory before saving it, directory to export columnar arrays to or None,
+        only validate the spreadsheets)
+    """
+    spreadsheet_files = []
+    all_sheets = False
+    workers = os.cpu_count() or 1
+    database_filename = db_table.DB_NAME
+    in_memory = False
+    export_directory = None
+    dry_run = False
+
+    index = 1
+
+    while index < len(cmdline):
+        arg = cmdline[index]
+
+        if arg == "--all-sheets":
+            all_sheets = True
+        elif arg == "--in-memory":
+            in_memory = True
+        elif arg == "--dry-run":
+            dry_run = True
+        elif arg == "--workers":
+            if index + 1 >= len(cmdline) or not cmdline[index + 1].isdigit() or int(cmdline[index + 1]) == 0:
+                raise ValueError("--workers expects a positive integer.")
+
+            workers = int(cmdline[index + 1])
+            index += 1
+        elif arg == "--db":
+            if index + 1 >= len(cmdline):
+                raise ValueError("--db expects a database path.")
+
+            database_filename = cmdline[index + 1]
+            index += 1
+        elif arg == "--export-columns":
+            if index + 1 >= len(cmdline):
+                raise ValueError("--export-columns expects a directory.")
+
+            export_directory = cmdline[index + 1]
+            index += 1
+        else:
+            spreadsheet_files.append(arg)
+
+        index += 1
+
+    # check if the commandline is valid
+    if not spreadsheet_files:
+        raise TypeError("Please provide your import in the following format: [spreadsheet] [more spreadsheets] [--all-sheets] [--workers N] [--db PATH] [--in-memory] [--export-columns DIR] [--dry-run]")
+
+    if db_table.is_in_memory(database_filename):
+        raise ValueError("--db has to be a database file, use --in-memory to build the database in memory.")
+
+    return (spreadsheet_files, all_sheets, workers, database_filename, in_memory, export_directory, dry_run)
 
     
+def build_agenda(sources: List[Tuple[str, int]], database_filename: str = ":memory:", workers: int = 1,
+                 import_generation: int = 1) -> AgendaDatabase:
+    """
+    Imports sheets into a new database, then indexes it. The database is left open so that an in-memory
+    database can be looked up or saved to disk.
+
+    Parameters
+    ------------
+    sources: List[Tuple[str, int]]
+        (spreadsheet filename, sheet index) of every sheet to import, in order
+    database_filename: str
+        the database to create, in memory by default. It must not exist yet
+    workers: int
+        the maximum number of worker processes when there are several sheets
+    import_generation: int
+        the generation of this import
+
+    Returns
+        the imported database
+    """
+
+    # begin reading in data and populating the database
+    if len(sources) == 1:
+        spreadsheet_file, sheet_index = sources[0]
+
+        agenda_database = AgendaToDatabase(spreadsheet_file, constants.NUM_SKIP_ROWS, sheet_index)
+        agenda_database.create_tables(database_filename)
+        agenda_database.populate_database()
+    else:
+        agenda_database = AgendaDatabase()
+        agenda_database.create_tables(database_filename)
+        import_in_parallel(sources, constants.NUM_SKIP_ROWS, agenda_database, workers)
+
+    agenda_database.build_suggestions()
+    agenda_database.create_indexes()
+    agenda_database.record_import_generation(import_generation)
+
+    return agenda_database
+
+
 def main():
 
-    # remove the database file if it already exists.
-    database_filename = 'interview_test.db'
+    # grabbing the spreadsheet filenames from the command line
+    spreadsheet_files, all_sheets, workers, database_filename, in_memory, export_directory, dry_run = parse_command_line(sys.argv)
+
+    sources = list_sources(spreadsheet_files, all_sheets)
+
+    # validate the sheets without touching the database
+    if dry_run:
+        reports = [validate_agenda(source, constants.NUM_SKIP_ROWS) for source in sources]
+
+        for report in reports:
+            print_validation_report(report)
+
+        # fail like an import would
+        if any(problem[1] == "error" for report in reports for problem in report['problems']):
+            sys.exit(1)
+
+        return
+
+    # the new database continues the generation count of the one it replaces
+    import_generation = 1
 
     if(os.path.exists(database_filename)):
-        os.remove(database_filename)
+        import_generation = get_import_generation(database_filename) + 1
 
-    # check if the commandline is valid
-    if(len(sys.argv) != 2):
-        raise TypeError("import_agenda expected 2 arguments. {} was given".format(len(sys.argv)))
-    
-    # grabbing the spreadsheet filename from the command line
-    spreadsheet_file = sys.argv[1]
+    if in_memory:
+        # the database file keeps serving lookups until the import is copied over it
+        agenda_database = build_agenda(sources, ":memory:", workers, import_generation)
+        agenda_database.backup(database_filename)
+    else:
+        # remove the database file if it already exists.
+        if(os.path.exists(database_filename)):
+            os.remove(database_filename)
 
-    # rows to skip before reading in data
-    num_skip_rows = 15
+        agenda_database = build_agenda(sources, database_filename, workers, import_generation)
 
-    # begin reading in data and populating the database
-    agenda_to_database = AgendaToDatabase(spreadsheet_file, num_skip_rows)
-    agenda_to_database.create_tables()
-    agenda_to_database.populate_database()
+    if export_directory is not None:
+        agenda_database.export_columns(export_directory)
+
+    agenda_database.close()
 
 
 
 if __name__ == "__main__":
     main()
     
-    
\ No newline at end of file
@@ -3,18 +3,54 @@
 # to access command line arguments
 import sys
 
+# to detect changes to the database file without querying it
+import os
+
+# to open the database file read-only through a URI
+from urllib.request import pathname2url
+
+# --json output
+import json
+
+# ordered dictionary used as the LRU store of the query cache
+from collections import OrderedDict
+
+# the query cache can be shared by lookups running on several threads
+import threading
+
+# sharded lookups query every event database concurrently
+from concurrent.futures import ThreadPoolExecutor
+
 from html2text import html2text
 
 # sqlite wrapper class
 from db_table import db_table
 
+# connections handed in by callers that manage their own
+import sqlite3
+
 # for method typing
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 # python modules for table definitions and constants
 import table_definitions as table_defs
 import agenda_constants as constants
 
+# plans lookups made of several column=value predicates
+from query_planner import QueryPlanner
+
+# type-ahead completion of speaker names, titles and locations
+from prefix_index import PrefixIndex, load_prefix_indexes, normalize_key
+
+# statement timing and slow query log
+from query_profiler import QueryProfiler, print_report
+
+# schedule conflicts
+from schedule_index import ScheduleIndex, session_interval
+
+# to split the times of a free rooms request
+import re
+
 """
 This script filters and queries the tables in the database created from import_agenda.py
 
@@ -95,6 +131,359 @@ def parse_command_line(cmdline: List[str]) -> Dict[str, str]:
 
     return lookup_dict
 
+def parse_page_options(cmdline: List[str]) -> Tuple[List[str], Optional[int], Optional[int]]:
+    """
+    Removes the pagination options from the command line.
+        --limit N       print at most N rows
+        --after CURSOR  print the page following the page that ended with CURSOR
+
+    Paramaters
+    -------------
+    cmdline: List[str]
+        the commandline arguments
+
+    Returns
+        (the remaining commandline arguments, the page size or None, the cursor or None)
+    """
+
+    remaining_args = []
+    options = {"--limit": None, "--after": None}
+
+    index = 0
+
+    while index < len(cmdline):
+        arg = cmdline[index]
+
+        if arg in options:
+            if index + 1 >= len(cmdline) or not cmdline[index + 1].isdigit():
+                raise ValueError("{} expects a positive integer.".format(arg))
+
+            options[arg] = int(cmdline[index + 1])
+            index += 2
+        else:
+            remaining_args.append(arg)
+            index += 1
+
+    if options["--limit"] == 0:
+        raise ValueError("--limit expects a positive integer.")
+
+    # a cursor alone pages with the default page size
+    if options["--after"] is not None and options["--limit"] is None:
+        options["--limit"] = constants.DEFAULT_PAGE_SIZE
+
+    return (remaining_args, options["--limit"], options["--after"])
+
+
+def parse_database_options(cmdline: List[str]) -> Tuple[List[str], Optional[str], List[str]]:
+    """
+    Removes the database options from the command line.
+        --db PATH     look up the event database at PATH instead of db_table.DB_NAME
+        --shard PATH  look up the event database at PATH, or every .db file in the directory PATH.
+                      Can be repeated to look up several event databases at once
+
+    Paramaters
+    -------------
+    cmdline: List[str]
+        the commandline arguments
+
+    Returns
+        (the remaining commandline arguments, the database or None, the shard databases)
+    """
+
+    remaining_args = []
+    db_name = None
+    shards = []
+
+    index = 0
+
+    while index < len(cmdline):
+        arg = cmdline[index]
+
+        if arg in ("--db", "--shard"):
+            if index + 1 >= len(cmdline):
+                raise ValueError("{} expects a database path.".format(arg))
+
+            if arg == "--db":
+                db_name = cmdline[index + 1]
+            else:
+                shards.append(cmdline[index + 1])
+
+            index += 2
+        else:
+            remaining_args.append(arg)
+            index += 1
+
+    if db_name is not None and shards:
+        raise ValueError("--db and --shard cannot be combined.")
+
+    return (remaining_args, db_name, shards)
+
+
+def parse_output_options(cmdline: List[str]) -> Tuple[List[str], str]:
+    """
+    Removes the output options from the command line.
+        --json    print the rows as JSON, with their full description
+        --detail  print every row with its full description
+
+    Paramaters
+    -------------
+    cmdline: List[str]
+        the commandline arguments
+
+    Returns
+        (the remaining commandline arguments, one of "table", "json" or "detail")
+    """
+
+    output_formats = {"--json": "json", "--detail": "detail"}
+
+    remaining_args = [arg for arg in cmdline if arg not in output_formats]
+    requested_formats = [output_formats[arg] for arg in cmdline if arg in output_formats]
+
+    if len(set(requested_formats)) > 1:
+        raise ValueError("--json and --detail cannot be combined.")
+
+    return (remaining_args, requested_formats[0] if requested_formats else "table")
+
+
+def parse_profile_options(cmdline: List[str]) -> Tuple[List[str], bool, float, str]:
+    """
+    Removes the profiling options from the command line.
+        --profile        time every statement, log the slow ones with their query plan and print the hottest query shapes
+        --slow-ms N      log the statements taking at least N milliseconds, constants.SLOW_QUERY_MS by default
+        --slow-log PATH  append the slow statements to PATH, constants.SLOW_QUERY_LOG_NAME by default
+
+    --slow-ms and --slow-log imply --profile.
+
+    Paramaters
+    -------------
+    cmdline: List[str]
+        the commandline arguments
+
+    Returns
+        (the remaining commandline arguments, True if the lookup is profiled, the slow query threshold in
+        milliseconds, the slow query log)
+    """
+
+    remaining_args = []
+    profile = False
+    slow_query_ms = constants.SLOW_QUERY_MS
+    slow_query_log = constants.SLOW_QUERY_LOG_NAME
+
+    index = 0
+
+    while index < len(cmdline):
+        arg = cmdline[index]
+
+        if arg == "--profile":
+            profile = True
+            index += 1
+        elif arg in ("--slow-ms", "--slow-log"):
+            if index + 1 >= len(cmdline):
+                raise ValueError("{} expects a value.".format(arg))
+
+            if arg == "--slow-ms":
+                try:
+                    slow_query_ms = float(cmdline[index + 1])
+                except ValueError:
+                    slow_query_ms = -1
+
+                if slow_query_ms < 0:
+                    raise ValueError("--slow-ms expects a number of milliseconds.")
+            else:
+                slow_query_log = cmdline[index + 1]
+
+            profile = True
+            index += 2
+        else:
+            remaining_args.append(arg)
+            index += 1
+
+    return (remaining_args, profile, slow_query_ms, slow_query_log)
+
+
+def is_compound_query(cmdline: List[str]) -> bool:
+    """
+    Compound lookups are written as column=value predicates, e.g. speaker="Shan Lu" AND date=06/17/2018
+
+    Parameters
+    -------------
+    cmdline: List[str]
+        the commandline arguments
+
+    Returns
+        True if the lookup is a compound lookup
+    """
+    return len(cmdline) > 1 and "=" in cmdline[1]
+
+
+def parse_compound_query(cmdline: List[str]) -> List[List[Tuple[str, str]]]:
+    """
+    Parses a compound lookup made of column=value predicates joined by AND / OR.
+    AND binds tighter than OR, so "a=1 AND b=2 OR c=3" matches (a=1 AND b=2) OR c=3.
+    Values that contain the words "and" or "or" have to be quoted.
+
+    Paramaters
+    -------------
+    cmdline: List[str]
+        the commandline arguments
+    
+    Returns
+        groups of (column_name, lookup_value) predicates. Predicates of a group are ANDed, groups are ORed
+    """
+
+    predicate_groups = [[]]
+    predicate = None
+
+    for arg in cmdline[1:]:
+
+        if arg.upper() in constants.COMPOUND_OPERATORS:
+            # an operator has to follow a predicate
+            if predicate is None:
+                raise TypeError("Please provide your query in the following format: [column]=[value] AND [column]=[value]")
+
+            predicate_groups[-1].append(predicate)
+            predicate = None
+
+            if arg.upper() == "OR":
+                predicate_groups.append([])
+
+        elif predicate is None:
+            if "=" not in arg:
+                raise TypeError("Please provide your query in the following format: [column]=[value] AND [column]=[value]")
+
+            column_name, lookup_val = arg.split("=", 1)
+            predicate = [column_name, lookup_val]
+
+        else:
+            # lookup values can be separated by whitespace
+            predicate[1] += " " + arg
+
+    if predicate is None:
+        raise TypeError("Please provide your query in the following format: [column]=[value] AND [column]=[value]")
+
+    predicate_groups[-1].append(predicate)
+
+    for predicates in predicate_groups:
+        for index, (column_name, lookup_val) in enumerate(predicates):
+
+            # if the user inputs a wrong column name
+            if(column_name not in constants.LOOKUP_COLS):
+                raise ValueError("{} is not a valid lookup column.".format(column_name))
+
+            predicates[index] = (column_name, sanitize_string(lookup_val))
+
+    return predicate_groups
+
+
+def is_suggest_command(cmdline: List[str]) -> bool:
+    """
+    Completions are requested as: suggest [speaker|title|location] [prefix]
+    """
+    return len(cmdline) > 1 and cmdline[1] == "suggest"
+
+
+def parse_suggest_command(cmdline: List[str]) -> Tuple[str, str]:
+    """
+    Parses a completion request.
+
+    Paramaters
+    -------------
+    cmdline: List[str]
+        the commandline arguments, starting with the program name and "suggest"
+
+    Returns
+        (the kind of name to complete, the typed prefix, empty to list the names with the most sessions)
+    """
+
+    if len(cmdline) < 3:
+        raise TypeError("Please provide your completion request in the following format: suggest [speaker|title|location] [prefix]")
+
+    kind = cmdline[2]
+
+    if kind not in constants.SUGGEST_COLS:
+        raise ValueError("{} is not a valid suggestion column.".format(kind))
+
+    # the prefix can be separated by whitespace
+    return (kind, sanitize_string(" ".join(cmdline[3:])))
+
+
+def is_conflicts_command(cmdline: List[str]) -> bool:
+    """
+    Schedule conflicts are requested as: conflicts [room|speaker]
+    """
+    return len(cmdline) > 1 and cmdline[1] == "conflicts"
+
+
+def parse_conflicts_command(cmdline: List[str]) -> Tuple[str, ...]:
+    """
+    Parses a conflict report request.
+
+    Paramaters
+    -------------
+    cmdline: List[str]
+        the commandline arguments, starting with the program name and "conflicts"
+
+    Returns
+        the kinds of conflicts to report, every kind if none is given
+    """
+
+    if len(cmdline) > 3:
+        raise TypeError("Please provide your conflict report request in the following format: conflicts [room|speaker]")
+
+    if len(cmdline) == 2:
+        return constants.CONFLICT_KINDS
+
+    if cmdline[2] not in constants.CONFLICT_KINDS:
+        raise ValueError("{} is not a valid conflict kind.".format(cmdline[2]))
+
+    return (cmdline[2],)
+
+
+def is_free_command(cmdline: List[str]) -> bool:
+    """
+    Free rooms are requested as: free [date] [time] [end time]
+    """
+    return len(cmdline) > 1 and cmdline[1] == "free"
+
+
+def parse_free_command(cmdline: List[str]) -> Tuple[str, int, int]:
+    """
+    Parses a free rooms request, e.g. free 06/17/2018 10:00 AM 11:00 AM
+    Without an end time, rooms are checked at the start time only.
+
+    Paramaters
+    -------------
+    cmdline: List[str]
+        the commandline arguments, starting with the program name and "free"
+
+    Returns
+        (the date, the start of the window, its end) in minutes as returned by schedule_index.session_interval
+    """
+
+    usage = "Please provide your free rooms request in the following format: free [MM/DD/YYYY] [HH:MM AM] [HH:MM PM]"
+
+    if len(cmdline) < 4:
+        raise TypeError(usage)
+
+    date = cmdline[2]
+
+    # times can be quoted or not, "10:00 AM" and 10:00 AM
+    times_string = " ".join(cmdline[3:]).upper()
+    times = re.findall(r"\d{1,2}:\d{2} ?[AP]M", times_string)
+
+    if len(times) not in (1, 2) or re.sub(r"\d{1,2}:\d{2} ?[AP]M", "", times_string).strip():
+        raise TypeError(usage)
+
+    # 10:00AM is read as 10:00 AM
+    times = [time.replace(" ", "")[:-2] + " " + time[-2:] for time in times]
+    interval = session_interval(date, times[0], times[-1])
+
+    if interval is None:
+        raise ValueError("{} {} is not a valid date and time.".format(date, " - ".join(times)))
+
+    return (date, interval[0], interval[1])
+
+
 def shorten_string(val:str, width:int) -> str:
     """
     Takes a string and shortens it down a specified width and appends an elipsis if 
@@ -136,15 +525,21 @@ def print_query_result(result: List[Dict[str,str]]) -> None:
     # column widths for header
     title_width = 40
     location_width = 20
-    description_width = 45
+    description_width = constants.DESCRIPTION_DISPLAY_WIDTH
     type_width = 35
 
+    # sharded lookups also print the event database of each row
+    shard_width = 20 if result and 'shard' in result[0] else 0
+
     # underlying border under the header columns
-    total_width = title_width + location_width + description_width + type_width
+    total_width = shard_width + title_width + location_width + description_width + type_width
     header_underline = "=" * total_width
 
     # query header
 
+    if shard_width:
+        print('{:<20}'.format('Event'), end=' ')
+
     print(
         '{:<{}}'.format('Title', title_width),
         '{:<20}'.format('Location'),
@@ -159,9 +554,16 @@ def print_query_result(result: List[Dict[str,str]]) -> None:
         # shorten the strings and append an ellipsis 
         title = shorten_string(row['title'], title_width)
         location = shorten_string(row['location'], location_width)
-        description = shorten_string(row['description'], description_width)
+        # rows projected with SESSIONS_DISPLAY_COLS carry the description already shortened at import
+        if 'description_summary' in row:
+            description = row['description_summary']
+        else:
+            description = shorten_string(row['description'], description_width)
         session_type = shorten_string(row['session_type'], type_width)
 
+        if shard_width:
+            print('{0: <20}'.format(shorten_string(row['shard'], shard_width)), end=' ')
+
         print(
             '{0: <40}'.format(title),
             '{0: <20}'.format(location),
@@ -172,131 +574,709 @@ def print_query_result(result: List[Dict[str,str]]) -> None:
     print()
         
 
-def select_from_sessions_columns(lookup_dict: Dict[str,str]) -> List[Dict[str,str]]:
+def print_query_details(result: List[Dict[str,str]]) -> None:
     """
-    Uses the sqlite wrapper class to select and filter rows passed in through lookup_dict.
+    Prints every row of a query with its full description.
 
     Parameters
     -----------
-    lookup_dict: Dict[str,str]
-        dictionary containing the column name and the value to search for
-
-    Returns
-        - a list of dictionaries returned from the search query. 
-        - an empty list if no rows match the lookup value
+    result: List[Dict[str, str]]
+        a list of dictionaries returned from a query, including the description column
     """
 
-    # connect to the sessions table
-    sessions = db_table(constants.SESSIONS_TABLE_NAME, table_defs.sessions_dict)
+    for row in result:
+        if 'shard' in row:
+            print('{:<13}{}'.format('Event:', row['shard']))
 
-    # grab all sessions that match the value provided
-    parent_result = sessions.select(constants.SESSIONS_COLS, lookup_dict)
+        print('{:<13}{}'.format('Title:', row['title']))
+        print('{:<13}{}'.format('Location:', row['location']))
+        print('{:<13}{}'.format('Type:', row['session_type']))
+        print('{:<13}{}'.format('Description:', row['description']))
+        print()
 
-    final_result = []
 
-    # index to skip over subsessions if they are already added
-    latest_subsession_id = 0
-    
+def print_query_json(result: List[Dict[str,str]]) -> None:
+    """
+    Prints the rows of a query as a JSON array.
 
-    for row in parent_result:
-        
-        # if this row has already been added, skip it
-        if(row['session_id'] > latest_subsession_id):
-            final_result.append(row)
+    Parameters
+    -----------
+    result: List[Dict[str, str]]
+        a list of dictionaries returned from a query, including the description column
+    """
 
-      
-        # query the sessions' subsessions if it has any
-        if(row["session_type"] == "Session"):
-            subsessions_query = sessions.select(constants.SESSIONS_COLS, {'parent_session_id': str(row['session_id'])})
+    json_rows = []
+
+    for row in result:
+        json_row = dict(row)
 
-            for subsession_row in subsessions_query:
-                final_result.append(subsession_row)
+        # the summary is only a display helper
+        json_row.pop('description_summary', None)
 
-                # keep track of the last subsession's index
-                if(subsession_row['session_id'] > latest_subsession_id):
-                    latest_subsession_id = subsession_row['session_id']
+        # top level sessions store their missing parent as text
+        if not isinstance(json_row.get('parent_session_id'), int):
+            json_row['parent_session_id'] = None
 
+        json_rows.append(json_row)
+
+    print(json.dumps(json_rows, indent=2))
 
-    return final_result
 
-def select_from_speakers_column(lookup_dict: Dict[str,str]) -> List[Dict[str,str]]:
+def print_suggestions(suggestions: List[Tuple[str, int]], output_format: str) -> None:
     """
-    Uses the sqlite wrapper class to select and filter rows passed in through lookup_dict.
-    Does multiple queries to traverse tables in order to get the sessions rows
+    Prints the completions of a prefix, most sessions first.
 
     Parameters
-    ------------
-    lookup_dict: dict
-        dictionary containing the column name and the value to search for
-    
-    Returns
-        -a list of dictionaries returned from the query. 
-        -an empty list if the speaker is not in any session
+    -----------
+    suggestions: List[Tuple[str, int]]
+        (name, session count) pairs returned by suggest
+    output_format: str
+        "json" to print a JSON array, any other format prints one completion per line
     """
-    
-    # create connections with the tables
-    sessions = db_table(constants.SESSIONS_TABLE_NAME, table_defs.sessions_dict)
-    speakers = db_table(constants.SPEAKERS_TABLE_NAME, table_defs.speakers_dict)
-    sessions_speakers = db_table(constants.SESSIONS_SPEAKERS_TABLE_NAME, table_defs.sessions_speakers_dict)
 
-    # first, lookup the speaker name in the speakers table
-    speakers_query_result = speakers.select(constants.SPEAKERS_COLS, lookup_dict)
+    if output_format == "json":
+        print(json.dumps([{'suggestion': name, 'session_count': count} for name, count in suggestions], indent=2))
+        return
 
-    # return an empty list if the speaker was not found
-    if len(speakers_query_result) == 0:
-        return []
-    
-    # grab the speaker dictionary row if the query returned a value
-    speakers_query_result = speakers_query_result[0]
+    for name, count in suggestions:
+        print("{} ({} session{})".format(name, count, "" if count == 1 else "s"))
 
-    final_result = []
 
-    if speakers_query_result:
+def print_conflicts(conflicts: List[Dict[str,str]], output_format: str) -> None:
+    """
+    Prints the conflicting sessions of a schedule, one pair per line.
 
-        # dictionary to look up corresponding rows in the sessions_speakers table
-        speaker_id_dict = {'speaker_id': str(speakers_query_result['speaker_id'])}
+    Parameters
+    -----------
+    conflicts: List[Dict[str, str]]
+        conflicts returned by find_conflicts
+    output_format: str
+        "json" to print a JSON array, any other format prints a table
+    """
 
-        # query the sessions_speakers table filtering by speaker id
-        sessions_speakers_id = sessions_speakers.select(constants.SESSIONS_SPEAKERS_COLS, speaker_id_dict)
+    if output_format == "json":
+        print(json.dumps(conflicts, indent=2))
+        return
 
-        # index to skip over subsessions if they are already added
-        latest_subsession_index = 0
+    print(
+        '{:<8}'.format('Kind'),
+        '{:<25}'.format('Room / Speaker'),
+        '{:<11}'.format('Date'),
+        '{:<35}'.format('Session'),
+        '{:<35}'.format('Overlaps')
+    )
 
-        for row in sessions_speakers_id:
+    print("=" * 118)
 
-            session_row_dict = {}
-            session_row_dict['session_id'] = row['session_id']
+    for row in conflicts:
+        session = "{}-{} {}".format(row['time_start'], row['time_end'], row['title'])
+        other_session = "{}-{} {}".format(row['other_time_start'], row['other_time_end'], row['other_title'])
 
-            # query the sessions table using the session_id returned from sessions_speakers
-            parent_result = sessions.select(constants.SESSIONS_COLS, session_row_dict)[0]
+        print(
+            '{0: <8}'.format(row['conflict']),
+            '{0: <25}'.format(shorten_string(row['resource'], 25)),
+            '{0: <11}'.format(row['date']),
+            '{0: <35}'.format(shorten_string(session, 35)),
+            '{0: <35}'.format(shorten_string(other_session, 35))
+        )
 
-            # if this row has already been added, skip it
-            if(parent_result['session_id'] > latest_subsession_index):
-                final_result.append(parent_result)
+    print()
+    print("{} conflict{} found".format(len(conflicts), "" if len(conflicts) == 1 else "s"))
 
-            # If this session has any subsessions, search for them and append them to the final result
-            if parent_result['session_type'] == 'Session':
 
-                parent_id = parent_result['session_id']
-                subsessions = sessions.select(constants.SESSIONS_COLS, {'parent_session_id': parent_id})
+def print_free_rooms(rooms: List[Dict[str,str]], date: str, output_format: str) -> None:
+    """
+    Prints whether each room is free and its next free slot.
 
-                for subsession in subsessions:
+    Parameters
+    -----------
+    rooms: List[Dict[str, str]]
+        rooms returned by free_rooms
+    date: str
+        the date of the request, free slots on that date are printed without their date
+    output_format: str
+        "json" to print a JSON array, any other format prints a table
+    """
 
-                    # keep track of the last subsession's index
-                    if(subsession['session_id'] > latest_subsession_index):
-                        latest_subsession_index = subsession['session_id']
+    if output_format == "json":
+        print(json.dumps(rooms, indent=2))
+        return
 
-                    final_result.append(subsession)
+    print(
+        '{:<25}'.format('Room'),
+        '{:<6}'.format('Free'),
+        '{:<22}'.format('Free from'),
+        '{:<22}'.format('Free until')
+    )
 
+    print("=" * 78)
 
-    return final_result
+    for room in rooms:
+        free_from = room['free_from'].replace(date + " ", "")
+        free_until = room['free_until'].replace(date + " ", "") if room['free_until'] else "-"
 
+        print(
+            '{0: <25}'.format(shorten_string(room['location'], 25)),
+            '{0: <6}'.format("yes" if room['free'] else "no"),
+            '{0: <22}'.format(free_from),
+            '{0: <22}'.format(free_until)
+        )
+
+    print()
+
+
+def load_descriptions(result: List[Dict[str,str]], tables: Dict[str, db_table]) -> None:
+    """
+    Adds the full description to rows fetched with SESSIONS_DISPLAY_COLS, for the outputs that need it.
+    Descriptions are read in one query per chunk of rows instead of along with every lookup.
+
+    Parameters
+    -----------
+    result: List[Dict[str, str]]
+        a list of dictionaries returned from a query, including the session_id column
+    tables: Dict[str, db_table]
+        tables returned by connect_tables the rows were read from
+    """
+
+    sessions = tables[constants.SESSIONS_TABLE_NAME]
+    descriptions = {}
+
+    session_ids = [row['session_id'] for row in result]
+
+    # stay under the number of placeholders SQLite accepts in a statement
+    for start in range(0, len(session_ids), constants.DESCRIPTION_CHUNK_SIZE):
+        chunk = session_ids[start:start + constants.DESCRIPTION_CHUNK_SIZE]
+        query = "SELECT session_id, description FROM %s WHERE session_id IN (%s)" % (
+            constants.SESSIONS_TABLE_NAME, ", ".join(["?"] * len(chunk)))
+
+        for row in sessions.select_query(query, chunk):
+            descriptions[row['session_id']] = row['description']
+
+    for row in result:
+        row['description'] = descriptions.get(row['session_id'])
+
+
+def connect_tables(db_conn: Optional[sqlite3.Connection] = None, db_name: Optional[str] = None) -> Dict[str, db_table]:
+    """
+    Connects to the sessions, speakers and sessions_speakers tables over a single database connection.
+
+    Parameters
+    -----------
+    db_conn: Optional[sqlite3.Connection]
+        the connection to use. A new connection to the database is opened if none is given
+    db_name: Optional[str]
+        the database to connect to, or that db_conn is connected to. db_table.DB_NAME by default
+
+    Returns
+        a dictionary mapping each table name to its db_table
+    """
+
+    sessions = db_table(constants.SESSIONS_TABLE_NAME, table_defs.sessions_dict, db_conn, db_name)
+    speakers = db_table(constants.SPEAKERS_TABLE_NAME, table_defs.speakers_dict, sessions.db_conn, db_name)
+    sessions_speakers = db_table(constants.SESSIONS_SPEAKERS_TABLE_NAME, table_defs.sessions_speakers_dict, sessions.db_conn, db_name)
+
+    return {
+        constants.SESSIONS_TABLE_NAME: sessions,
+        constants.SPEAKERS_TABLE_NAME: speakers,
+        constants.SESSIONS_SPEAKERS_TABLE_NAME: sessions_speakers
+    }
+
+
+def read_subsessions(sessions: db_table, session_id: int, subtree_end: int, columns: Tuple[str, ...]) -> List[Dict[str,str]]:
+    """
+    Reads the subsessions of a session from the session tree materialized by import_agenda.py.
+    They are the contiguous session_id range (session_id, subtree_end], read with a single range scan.
+
+    Parameters
+    -----------
+    sessions: db_table
+        the sessions table
+    session_id: int
+        the parent session
+    subtree_end: int
+        the session_id of its last subsession
+    columns: Tuple[str, ...]
+        the sessions columns to fetch
+
+    Returns
+        the subsessions, in display order
+    """
+    return sessions.select(columns, order_by='session_id', after=session_id, limit=subtree_end - session_id)
+
+
+def select_from_sessions_columns(lookup_dict: Dict[str,str], tables: Optional[Dict[str, db_table]] = None,
+                                 columns: Tuple[str, ...] = constants.SESSIONS_COLS) -> List[Dict[str,str]]:
+    """
+    Uses the sqlite wrapper class to select and filter rows passed in through lookup_dict.
+
+    Parameters
+    -----------
+    lookup_dict: Dict[str,str]
+        dictionary containing the column name and the value to search for
+    tables: Optional[Dict[str, db_table]]
+        tables returned by connect_tables to run the queries on. New connections are opened if none are given
+    columns: Tuple[str, ...]
+        the sessions columns to fetch, they have to include session_id and session_type
+
+    Returns
+        - a list of dictionaries returned from the search query. 
+        - an empty list if no rows match the lookup value
+    """
 
-def main():
     # connect to the sessions table
-    sessions = db_table(constants.SESSIONS_TABLE_NAME, table_defs.sessions_dict)
+    if tables is None:
+        tables = connect_tables()
+
+    sessions = tables[constants.SESSIONS_TABLE_NAME]
+
+    # grab all sessions that match the value provided, along with the end of their range in the session tree
+    parent_result = sessions.select(tuple(columns) + ('subtree_end',), lookup_dict)
+
+    final_result = []
+
+    # index to skip over subsessions if they are already added
+    latest_subsession_id = 0
+    
+
+    for row in parent_result:
+
+        subtree_end = row['subtree_end'] if 'subtree_end' in columns else row.pop('subtree_end')
+        
+        # if this row has already been added, skip it
+        if(row['session_id'] > latest_subsession_id):
+            final_result.append(row)
+
+      
+        # the session's subsessions are stored right after it, read them as one range
+        if(subtree_end > row['session_id'] and subtree_end > latest_subsession_id):
+            final_result += read_subsessions(sessions, row['session_id'], subtree_end, columns)
+
+            # keep track of the last subsession's index
+            latest_subsession_id = subtree_end
+
+
+    return final_result
+
+def select_from_speakers_column(lookup_dict: Dict[str,str], tables: Optional[Dict[str, db_table]] = None,
+                                columns: Tuple[str, ...] = constants.SESSIONS_COLS) -> List[Dict[str,str]]:
+    """
+    Uses the sqlite wrapper class to select and filter rows passed in through lookup_dict.
+    Does multiple queries to traverse tables in order to get the sessions rows
+
+    Parameters
+    ------------
+    lookup_dict: dict
+        dictionary containing the column name and the value to search for
+    tables: Optional[Dict[str, db_table]]
+        tables returned by connect_tables to run the queries on. New connections are opened if none are given
+    columns: Tuple[str, ...]
+        the sessions columns to fetch, they have to include session_id and session_type
+    
+    Returns
+        -a list of dictionaries returned from the query. 
+        -an empty list if the speaker is not in any session
+    """
+    
+    # create connections with the tables
+    if tables is None:
+        tables = connect_tables()
+
+    sessions = tables[constants.SESSIONS_TABLE_NAME]
+    speakers = tables[constants.SPEAKERS_TABLE_NAME]
+    sessions_speakers = tables[constants.SESSIONS_SPEAKERS_TABLE_NAME]
+
+    # first, lookup the speaker name in the speakers table
+    speakers_query_result = speakers.select(constants.SPEAKERS_COLS, lookup_dict)
+
+    # return an empty list if the speaker was not found
+    if len(speakers_query_result) == 0:
+        return []
+    
+    # grab the speaker dictionary row if the query returned a value
+    speakers_query_result = speakers_query_result[0]
+
+    final_result = []
+
+    if speakers_query_result:
+
+        # dictionary to look up corresponding rows in the sessions_speakers table
+        speaker_id_dict = {'speaker_id': str(speakers_query_result['speaker_id'])}
+
+        # query the sessions_speakers table filtering by speaker id
+        sessions_speakers_id = sessions_speakers.select(constants.SESSIONS_SPEAKERS_COLS, speaker_id_dict)
+
+        # index to skip over subsessions if they are already added
+        latest_subsession_index = 0
+
+        for row in sessions_speakers_id:
+
+            session_row_dict = {}
+            session_row_dict['session_id'] = row['session_id']
+
+            # query the sessions table using the session_id returned from sessions_speakers
+            parent_result = sessions.select(tuple(columns) + ('subtree_end',), session_row_dict)[0]
+
+            subtree_end = parent_result['subtree_end'] if 'subtree_end' in columns else parent_result.pop('subtree_end')
+
+            # if this row has already been added, skip it
+            if(parent_result['session_id'] > latest_subsession_index):
+                final_result.append(parent_result)
+
+            # If this session has any subsessions, read their range and append them to the final result
+            if(subtree_end > parent_result['session_id'] and subtree_end > latest_subsession_index):
+                final_result += read_subsessions(sessions, parent_result['session_id'], subtree_end, columns)
+
+                # keep track of the last subsession's index
+                latest_subsession_index = subtree_end
+
+
+    return final_result
+
+
+def select_compound(predicate_groups: List[List[Tuple[str, str]]], tables: Optional[Dict[str, db_table]] = None,
+                    columns: Tuple[str, ...] = constants.SESSIONS_COLS) -> List[Dict[str,str]]:
+    """
+    Runs a compound lookup as a single statement planned by QueryPlanner.
+
+    Parameters
+    ------------
+    predicate_groups: List[List[Tuple[str, str]]]
+        groups returned by parse_compound_query. Predicates of a group are ANDed, groups are ORed
+    tables: Optional[Dict[str, db_table]]
+        tables returned by connect_tables to run the query on. New connections are opened if none are given
+    columns: Tuple[str, ...]
+        the sessions columns to fetch
+
+    Returns
+        - a list of dictionaries containing the matching sessions and their subsessions
+        - an empty list if no rows match the predicates
+    """
+
+    if tables is None:
+        tables = connect_tables()
+
+    query, params = QueryPlanner(tables).plan(predicate_groups, columns=columns)
+
+    return tables[constants.SESSIONS_TABLE_NAME].select_query(query, params)
+
+
+def select_page(predicate_groups: List[List[Tuple[str, str]]], limit: int, after: Optional[int] = None,
+                tables: Optional[Dict[str, db_table]] = None,
+                columns: Tuple[str, ...] = constants.SESSIONS_COLS) -> Tuple[List[Dict[str,str]], Optional[int]]:
+    """
+    Returns one page of a lookup, paginated with a keyset cursor on session_id.
+
+    A page never splits a session from its subsessions: a group that does not fit in the page is
+    left for the next one, unless it is the first group of the page, which is then returned whole.
+    Only the first limit + 1 matching sessions after the cursor are read, so a page costs O(limit).
+
+    Parameters
+    ------------
+    predicate_groups: List[List[Tuple[str, str]]]
+        groups of (column, value) predicates. Predicates of a group are ANDed, groups are ORed
+    limit: int
+        the maximum number of rows in the page
+    after: Optional[int]
+        the cursor returned with the previous page, None for the first page
+    tables: Optional[Dict[str, db_table]]
+        tables returned by connect_tables to run the query on. New connections are opened if none are given
+    columns: Tuple[str, ...]
+        the sessions columns to fetch, they have to include session_id and parent_session_id
+
+    Returns
+        (the rows of the page, the cursor of the next page or None if this is the last page)
+    """
+
+    if tables is None:
+        tables = connect_tables()
+
+    # one extra match tells if there is a page after this one
+    query, params = QueryPlanner(tables).plan(predicate_groups, after, limit + 1, columns)
+    rows = tables[constants.SESSIONS_TABLE_NAME].select_query(query, params)
+
+    matched_count = sum(row.pop('matched') for row in rows)
+
+    # a group is a session followed by its subsessions, or a subsession matched on its own
+    row_groups = []
+
+    for row in rows:
+        if row_groups and row['parent_session_id'] == row_groups[-1][0]['session_id']:
+            row_groups[-1].append(row)
+        else:
+            row_groups.append([row])
+
+    page = []
+
+    for row_group in row_groups:
+        if page and len(page) + len(row_group) > limit:
+            break
+
+        page += row_group
+
+    # subsessions come right after their parent, so the cursor is past every row of the page's groups
+    if len(page) < len(rows):
+        return (page, page[-1]['session_id'])
+
+    # every row read fits in the page. Matches were cut off by the limit, but they may all be subsessions
+    # of the page's groups, so only hand out a cursor if a match is left after the page
+    if matched_count > limit:
+        query, params = QueryPlanner(tables).plan(predicate_groups, page[-1]['session_id'], 1, ('session_id', 'parent_session_id'))
+
+        if tables[constants.SESSIONS_TABLE_NAME].select_query(query, params):
+            return (page, page[-1]['session_id'])
+
+    return (page, None)
+
+
+def read_import_metadata(db_name: Optional[str] = None) -> Dict[str, str]:
+    """
+    Reads the import_metadata rows import_agenda.py writes on every import, without writing to the database.
+
+    Parameters
+    ------------
+    db_name: Optional[str]
+        the database to read the metadata of, db_table.DB_NAME by default
+
+    Returns
+        a dictionary mapping each meta_key to its meta_value, empty if the database has never been imported
+    """
+
+    db_name = db_name if db_name else db_table.DB_NAME
+
+    if db_table.is_in_memory(db_name) or db_name.startswith("file:"):
+        db_conn = db_table.connect(db_name)
+    elif os.path.exists(db_name):
+        # open the file read-only, a lookup must never write to a database an import may still be writing
+        db_conn = sqlite3.connect("file:{}?mode=ro".format(pathname2url(os.path.abspath(db_name))), uri=True)
+    else:
+        return {}
+
+    try:
+        metadata_rows = db_conn.execute("SELECT meta_key, meta_value FROM %s" % constants.IMPORT_METADATA_TABLE_NAME).fetchall()
+    except sqlite3.OperationalError as error:
+        # the metadata table only exists once an import has recorded its generation
+        if "no such table" not in str(error):
+            raise
+
+        metadata_rows = []
+    finally:
+        db_conn.close()
+
+    return dict(metadata_rows)
+
+
+def get_import_generation(db_name: Optional[str] = None) -> int:
+    """
+    Reads the import generation counter that import_agenda.py bumps on every import.
+
+    Parameters
+    ------------
+    db_name: Optional[str]
+        the database to read the counter of, db_table.DB_NAME by default
+
+    Returns
+        the current import generation, 0 if the database has never been imported
+    """
+
+    return int(read_import_metadata(db_name).get(constants.IMPORT_GENERATION_KEY, 0))
+
+
+def get_import_id(db_name: Optional[str] = None) -> Optional[str]:
+    """
+    Reads the unique id import_agenda.py gives every import. Unlike the generation, it is never repeated
+    by an import that starts over from a deleted database file, or by a database copied from another event.
+
+    Parameters
+    ------------
+    db_name: Optional[str]
+        the database to read the id of, db_table.DB_NAME by default
+
+    Returns
+        the id of the current import, None if the database has never been imported. Databases imported before
+        imports had an id are identified by their generation
+    """
+
+    metadata = read_import_metadata(db_name)
+
+    if constants.IMPORT_ID_KEY in metadata:
+        return metadata[constants.IMPORT_ID_KEY]
+
+    if constants.IMPORT_GENERATION_KEY in metadata:
+        return "generation " + str(metadata[constants.IMPORT_GENERATION_KEY])
+
+    return None
+
+
+class QueryCache():
+    """
+    Bounded least recently used cache of lookup results, shared by every database looked up.
+
+    Entries are only valid for the import of the database they were computed from. The database file is
+    stat-ed on every access so hot lookups never touch SQL; the import id is only re-read when the file has
+    changed on disk, and the entries of a database are dropped once it has been re-imported.
+    Databases without a file, such as in-memory databases, are never cached. The cache is thread-safe.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        """
+        Parameters
+        ------------
+        max_size: int
+            the maximum number of lookup results to keep
+        """
+
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+
+        # (import id, file fingerprint) of each database the cached entries were computed from
+        self.db_states = {}
+
+    def get_db_signature(self, db_name: str) -> Optional[Tuple[int, int, int]]:
+        """
+        Returns a cheap fingerprint of the database file, None if the file does not exist
+        """
+
+        try:
+            stat = os.stat(db_name)
+        except OSError:
+            return None
+
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def validate(self, db_name: str) -> bool:
+        """
+        Drops the entries of a database if it has been re-imported since they were cached.
+
+        Returns
+            True if the cache can be used, False if there is no database to cache results for
+        """
+
+        db_signature = self.get_db_signature(db_name)
 
-    lookup_dict = parse_command_line(sys.argv)
+        if db_signature is None:
+            self.clear(db_name)
+            return False
+
+        import_id, cached_signature = self.db_states.get(db_name, (None, None))
+
+        # the file changed on disk, check if it was re-imported. The fingerprint was taken before the import id
+        # is read, so an import finishing in between changes the file again and is checked on the next access
+        if db_signature != cached_signature:
+            current_import_id = get_import_id(db_name)
+
+            if current_import_id != import_id:
+                self.clear(db_name)
+
+            self.db_states[db_name] = (current_import_id, db_signature)
+
+        return True
+
+    def get_import_id(self, db_name: Optional[str] = None) -> Optional[str]:
+        """
+        Returns the id of the current import of a database, db_table.DB_NAME by default.
+        None if the database does not exist or has never been imported
+        """
+
+        db_name = db_name if db_name else db_table.DB_NAME
+
+        with self.lock:
+            if not self.validate(db_name):
+                return None
+
+            return self.db_states[db_name][0]
+
+    def get(self, key: Tuple, db_name: Optional[str] = None) -> Optional[List[Dict[str,str]]]:
+        """
+        Returns a copy of the result cached for key in a database, db_table.DB_NAME by default. None on a cache miss
+        """
+
+        db_name = db_name if db_name else db_table.DB_NAME
+
+        with self.lock:
+            if not self.validate(db_name) or (db_name, key) not in self.entries:
+                return None
+
+            self.entries.move_to_end((db_name, key))
+
+            # hand out copies so callers cannot modify the cached rows
+            return [dict(row) for row in self.entries[(db_name, key)]]
+
+    def put(self, key: Tuple, result: List[Dict[str,str]], db_name: Optional[str] = None) -> None:
+        """
+        Caches the result of key in a database, db_table.DB_NAME by default.
+        Evicts the least recently used entry if the cache is full
+        """
+
+        db_name = db_name if db_name else db_table.DB_NAME
+
+        with self.lock:
+            if not self.validate(db_name):
+                return
+
+            self.entries[(db_name, key)] = [dict(row) for row in result]
+            self.entries.move_to_end((db_name, key))
+
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self, db_name: Optional[str] = None) -> None:
+        """
+        Removes every cached entry of a database, or of every database if db_name is None
+        """
+
+        with self.lock:
+            if db_name is None:
+                self.entries.clear()
+                self.db_states.clear()
+                return
+
+            for entry_db_name, key in list(self.entries.keys()):
+                if entry_db_name == db_name:
+                    del self.entries[(entry_db_name, key)]
+
+            self.db_states.pop(db_name, None)
+
+
+def get_tables_db_name(tables: Optional[Dict[str, db_table]]) -> str:
+    """
+    Returns the database the tables returned by connect_tables are in, db_table.DB_NAME if there are no tables
+    """
+
+    if tables is None:
+        return db_table.DB_NAME
+
+    return tables[constants.SESSIONS_TABLE_NAME].db_name
+
+
+# results of recent lookups, shared by every lookup done in this process
+query_cache = QueryCache(constants.QUERY_CACHE_SIZE)
+
+
+def cached_lookup(lookup_dict: Dict[str,str], tables: Optional[Dict[str, db_table]] = None,
+                  columns: Tuple[str, ...] = constants.SESSIONS_COLS) -> List[Dict[str,str]]:
+    """
+    Looks up a column value returned by parse_command_line, answering from the query cache when possible.
+
+    Parameters
+    ------------
+    lookup_dict: Dict[str,str]
+        dictionary containing the lookup column and the sanitized value to search for
+    tables: Optional[Dict[str, db_table]]
+        tables returned by connect_tables to run the queries on on a cache miss
+    columns: Tuple[str, ...]
+        the sessions columns to fetch
+
+    Returns
+        a list of dictionaries containing the matching sessions and their subsessions
+    """
+
+    cache_key = (columns,) + tuple(sorted(lookup_dict.items()))
+
+    query_result = query_cache.get(cache_key, get_tables_db_name(tables))
+
+    if query_result is not None:
+        return query_result
 
     # if user is looking up a speaker, query from the speaker table.
     # else, query from the sessions table
@@ -304,12 +1284,445 @@ def main():
         speakers_lookup_dict = {}
         speakers_lookup_dict['speaker_name'] = lookup_dict['speaker']
 
-        query_result = select_from_speakers_column(speakers_lookup_dict)
+        query_result = select_from_speakers_column(speakers_lookup_dict, tables, columns)
     else:
-        query_result = select_from_sessions_columns(lookup_dict)
+        query_result = select_from_sessions_columns(lookup_dict, tables, columns)
+
+    query_cache.put(cache_key, query_result, get_tables_db_name(tables))
+
+    return query_result
+
+
+def cached_compound_lookup(predicate_groups: List[List[Tuple[str, str]]], tables: Optional[Dict[str, db_table]] = None,
+                           columns: Tuple[str, ...] = constants.SESSIONS_COLS) -> List[Dict[str,str]]:
+    """
+    Runs a compound lookup returned by parse_compound_query, answering from the query cache when possible.
+
+    Parameters
+    ------------
+    predicate_groups: List[List[Tuple[str, str]]]
+        groups of (column, value) predicates. Predicates of a group are ANDed, groups are ORed
+    tables: Optional[Dict[str, db_table]]
+        tables returned by connect_tables to run the query on on a cache miss
+    columns: Tuple[str, ...]
+        the sessions columns to fetch
+
+    Returns
+        a list of dictionaries containing the matching sessions and their subsessions
+    """
+
+    cache_key = ("compound", columns) + tuple(tuple(sorted(predicates)) for predicates in predicate_groups)
+
+    query_result = query_cache.get(cache_key, get_tables_db_name(tables))
+
+    if query_result is None:
+        query_result = select_compound(predicate_groups, tables, columns)
+        query_cache.put(cache_key, query_result, get_tables_db_name(tables))
+
+    return query_result
+
+
+def cached_page(predicate_groups: List[List[Tuple[str, str]]], limit: int, after: Optional[int] = None,
+                tables: Optional[Dict[str, db_table]] = None,
+                columns: Tuple[str, ...] = constants.SESSIONS_COLS) -> Tuple[List[Dict[str,str]], Optional[int]]:
+    """
+    Returns one page of a lookup as select_page does, answering from the query cache when possible.
+    """
+
+    cache_key = ("page", limit, after, columns) + tuple(tuple(sorted(predicates)) for predicates in predicate_groups)
+
+    # the cursor of the next page is cached as an extra row
+    cached_result = query_cache.get(cache_key, get_tables_db_name(tables))
+
+    if cached_result is not None:
+        return (cached_result[:-1], cached_result[-1]['next_cursor'])
+
+    page, next_cursor = select_page(predicate_groups, limit, after, tables, columns)
+    query_cache.put(cache_key, page + [{'next_cursor': next_cursor}], get_tables_db_name(tables))
+
+    return (page, next_cursor)
+
+
+# (import id, index) of each index loaded from each database, shared by every lookup in this process
+loaded_indexes = {}
+loaded_indexes_lock = threading.Lock()
+
+
+def get_loaded_index(index_name: str, load_index, tables: Optional[Dict[str, db_table]] = None):
+    """
+    Returns an in-memory index of a database. The index is only loaded on first use and after the database
+    has been re-imported.
+
+    Parameters
+    ------------
+    index_name: str
+        the name the index is cached under
+    load_index: Callable[[Dict[str, db_table]], Any]
+        loads the index from the tables of the database
+    tables: Optional[Dict[str, db_table]]
+        tables returned by connect_tables
+
+    Returns
+        the index loaded from the current import of the database
+    """
+
+    db_name = get_tables_db_name(tables)
+
+    # in-memory databases have no file to tell if they changed, their indexes are loaded on every use
+    import_id = query_cache.get_import_id(db_name)
+
+    if import_id is not None:
+        with loaded_indexes_lock:
+            cached_import_id, index = loaded_indexes.get((index_name, db_name), (None, None))
+
+            if index is not None and cached_import_id == import_id:
+                return index
+
+    if tables is None:
+        tables = connect_tables(db_name=db_name)
+
+    index = load_index(tables)
+
+    if import_id is not None:
+        with loaded_indexes_lock:
+            loaded_indexes[(index_name, db_name)] = (import_id, index)
+
+    return index
+
+
+def read_prefix_indexes(tables: Dict[str, db_table]) -> Dict[str, PrefixIndex]:
+    """
+    Reads the suggestions table into a prefix index for each kind of name
+    """
+
+    # rows are inserted sorted by kind and key, rowid order is key order
+    suggestion_rows = tables[constants.SESSIONS_TABLE_NAME].select_query(
+        "SELECT %s FROM %s ORDER BY rowid" % (", ".join(constants.SUGGESTIONS_COLS), constants.SUGGESTIONS_TABLE_NAME))
+
+    return load_prefix_indexes(suggestion_rows)
+
+
+def get_prefix_indexes(tables: Optional[Dict[str, db_table]] = None) -> Dict[str, PrefixIndex]:
+    """
+    Returns the prefix indexes of a database, mapping speaker, title and location to their prefix index
+    """
+
+    return get_loaded_index("prefix", read_prefix_indexes, tables)
+
+
+def read_schedule_index(tables: Dict[str, db_table]) -> ScheduleIndex:
+    """
+    Reads the schedule of every session and the speakers of every session into a schedule index
+    """
+
+    sessions = tables[constants.SESSIONS_TABLE_NAME].select(
+        ['session_id', 'subtree_end', 'title', 'location', 'date', 'time_start', 'time_end'])
+
+    sessions_speakers = tables[constants.SESSIONS_SPEAKERS_TABLE_NAME].select_query(
+        "SELECT ss.session_id, ss.speaker_id, sp.speaker_name FROM %s AS ss JOIN %s AS sp ON sp.speaker_id = ss.speaker_id" % (
+            constants.SESSIONS_SPEAKERS_TABLE_NAME, constants.SPEAKERS_TABLE_NAME))
+
+    return ScheduleIndex(sessions, sessions_speakers)
+
+
+def get_schedule_index(tables: Optional[Dict[str, db_table]] = None) -> ScheduleIndex:
+    """
+    Returns the schedule index of a database
+    """
+
+    return get_loaded_index("schedule", read_schedule_index, tables)
+
+
+def find_conflicts(kinds: Tuple[str, ...] = constants.CONFLICT_KINDS, tables: Optional[Dict[str, db_table]] = None) -> List[Dict[str,str]]:
+    """
+    Finds the rooms booked twice and the speakers scheduled in overlapping sessions.
+    A session never conflicts with its own subsessions.
+
+    Parameters
+    ------------
+    kinds: Tuple[str, ...]
+        the kinds of conflicts to find, from agenda_constants.CONFLICT_KINDS
+    tables: Optional[Dict[str, db_table]]
+        tables returned by connect_tables
+
+    Returns
+        a dictionary describing each pair of conflicting sessions, in schedule order within each kind
+    """
+
+    schedule_index = get_schedule_index(tables)
+    conflicts = []
+
+    if 'room' in kinds:
+        conflicts += schedule_index.room_conflicts()
+
+    if 'speaker' in kinds:
+        conflicts += schedule_index.speaker_conflicts()
+
+    return conflicts
+
+
+def suggest(kind: str, prefix: str, limit: int = constants.DEFAULT_SUGGESTIONS,
+            tables: Optional[Dict[str, db_table]] = None) -> List[Tuple[str, int]]:
+    """
+    Completes a speaker name, session title or location from the beginning of any of its words.
+
+    Parameters
+    ------------
+    kind: str
+        one of agenda_constants.SUGGEST_COLS
+    prefix: str
+        the typed prefix, case insensitive
+    limit: int
+        maximum number of completions
+    tables: Optional[Dict[str, db_table]]
+        tables returned by connect_tables
+
+    Returns
+        (name, number of sessions) of the top completions, most sessions first
+    """
+
+    return get_prefix_indexes(tables)[kind].complete(prefix, limit)
+
+
+def select_suggestions(kind: str, prefix: str, limit: int = constants.DEFAULT_SUGGESTIONS,
+                       tables: Optional[Dict[str, db_table]] = None) -> List[Tuple[str, int]]:
+    """
+    Completes a name like suggest, with a single range query on the (kind, suggestion_key) index instead of
+    loading the prefix index. Meant for one-off completions, such as a command line run per keystroke, where
+    loading the whole index would cost more than the completion itself.
+
+    Parameters
+    ------------
+    kind: str
+        one of agenda_constants.SUGGEST_COLS
+    prefix: str
+        the typed prefix, case insensitive
+    limit: int
+        maximum number of completions
+    tables: Optional[Dict[str, db_table]]
+        tables returned by connect_tables. New connections are opened if none are given
+
+    Returns
+        (name, number of sessions) of the top completions, most sessions first
+    """
+
+    if tables is None:
+        tables = connect_tables()
+
+    # the keys starting with the prefix sort before the prefix followed by the last code point, as in PrefixIndex.rank.
+    # a name can have several keys starting with the prefix, keep it once
+    rows = tables[constants.SESSIONS_TABLE_NAME].select_query(
+        "SELECT suggestion, MAX(session_count) AS session_count FROM %s "
+        "WHERE kind = ? AND suggestion_key >= ? AND suggestion_key < ? || char(1114111) "
+        "GROUP BY suggestion ORDER BY session_count DESC, suggestion LIMIT ?" % constants.SUGGESTIONS_TABLE_NAME,
+        [kind, normalize_key(prefix), normalize_key(prefix), limit])
+
+    return [(row['suggestion'], row['session_count']) for row in rows]
+
+
+def free_rooms(start: int, end: int, tables: Optional[Dict[str, db_table]] = None) -> List[Dict[str,str]]:
+    """
+    Tells which rooms are free over a window and when the others are free next.
+    Answered from the busy intervals of the schedule index, with a binary search per room.
+
+    Parameters
+    ------------
+    start: int
+        the start of the window, in minutes as returned by schedule_index.session_interval
+    end: int
+        the end of the window, equal to start to check a single time
+    tables: Optional[Dict[str, db_table]]
+        tables returned by connect_tables
+
+    Returns
+        a dictionary for each room, free rooms first, with the start and the end of its next free slot
+    """
+
+    return get_schedule_index(tables).free_rooms(start, end)
+
+
+def get_shard_name(db_name: str) -> str:
+    """
+    Names an event database after its filename, e.g. "events/isca_2018.db" -> "isca_2018"
+    """
+    return os.path.splitext(os.path.basename(db_name))[0]
+
+
+def list_shards(shard_paths: List[str]) -> List[str]:
+    """
+    Expands the --shard paths into the event databases to look up.
+
+    Parameters
+    ------------
+    shard_paths: List[str]
+        event databases, or directories whose .db files are event databases
+
+    Returns
+        the event databases, in the order given. The databases of a directory are sorted by name
+    """
+
+    db_names = []
+
+    for shard_path in shard_paths:
+        if os.path.isdir(shard_path):
+            db_names += sorted(os.path.join(shard_path, filename) for filename in os.listdir(shard_path) if filename.endswith(".db"))
+        elif os.path.isfile(shard_path):
+            db_names.append(shard_path)
+        else:
+            # connecting to a missing database would create an empty one
+            raise FileNotFoundError("{} is not an event database.".format(shard_path))
+
+    return db_names
+
+
+def sharded_lookup(predicate_groups: List[List[Tuple[str, str]]], db_names: List[str],
+                   workers: int = constants.SHARD_LOOKUP_WORKERS,
+                   columns: Tuple[str, ...] = constants.SESSIONS_COLS) -> List[Dict[str,str]]:
+    """
+    Runs a lookup on several event databases concurrently and merges the results.
+
+    Parameters
+    ------------
+    predicate_groups: List[List[Tuple[str, str]]]
+        groups of (column, value) predicates. Predicates of a group are ANDed, groups are ORed
+    db_names: List[str]
+        the event databases to look up
+    workers: int
+        the maximum number of event databases looked up at the same time
+    columns: Tuple[str, ...]
+        the sessions columns to fetch
+
+    Returns
+        the rows of every event database, each with a "shard" column naming its database. Rows are ordered
+        by the order of db_names, then as a lookup on a single database orders them
+    """
+
+    if not db_names:
+        return []
+
+    def lookup_shard(db_name):
+        tables = connect_tables(db_name=db_name)
+
+        try:
+            shard_result = cached_compound_lookup(predicate_groups, tables, columns)
+        finally:
+            tables[constants.SESSIONS_TABLE_NAME].close()
+
+        shard_name = get_shard_name(db_name)
+
+        for row in shard_result:
+            row['shard'] = shard_name
+
+        return shard_result
+
+    # the GIL is released while SQLite runs a query, so the event databases are searched in parallel
+    with ThreadPoolExecutor(max_workers=min(workers, len(db_names))) as executor:
+        shard_results = list(executor.map(lookup_shard, db_names))
+
+    return [row for shard_result in shard_results for row in shard_result]
+
+
+def print_lookup_result(result: List[Dict[str,str]], output_format: str) -> None:
+    """
+    Prints the rows of a lookup in the output format chosen on the command line
+    """
+
+    if output_format == "json":
+        print_query_json(result)
+    elif output_format == "detail":
+        print_query_details(result)
+    else:
+        print_query_result(result)
+
+
+def run_lookup(cmdline: List[str]) -> None:
+    """
+    Runs the lookup, completion or schedule report requested on the command line and prints its result
+    """
+
+    cmdline, db_name, shard_paths = parse_database_options(cmdline)
+    cmdline, limit, after = parse_page_options(cmdline)
+    cmdline, output_format = parse_output_options(cmdline)
+
+    if is_suggest_command(cmdline):
+        kind, prefix = parse_suggest_command(cmdline)
+
+        if shard_paths or after is not None:
+            raise ValueError("suggest cannot be combined with --shard or --after.")
+
+        limit = limit if limit is not None else constants.DEFAULT_SUGGESTIONS
+
+        # a single completion per run, reading the matching keys is cheaper than loading the prefix index
+        print_suggestions(select_suggestions(kind, prefix, limit, connect_tables(db_name=db_name)), output_format)
+        return
+
+    if is_conflicts_command(cmdline):
+        if shard_paths or limit is not None:
+            raise ValueError("conflicts cannot be combined with --shard, --limit or --after.")
+
+        print_conflicts(find_conflicts(parse_conflicts_command(cmdline), connect_tables(db_name=db_name)), output_format)
+        return
+
+    if is_free_command(cmdline):
+        if shard_paths or limit is not None:
+            raise ValueError("free cannot be combined with --shard, --limit or --after.")
+
+        date, start, end = parse_free_command(cmdline)
+        print_free_rooms(free_rooms(start, end, connect_tables(db_name=db_name)), date, output_format)
+        return
+
+    if is_compound_query(cmdline):
+        predicate_groups = parse_compound_query(cmdline)
+    else:
+        lookup_dict = parse_command_line(cmdline)
+        predicate_groups = [list(lookup_dict.items())]
+
+    # only read the full descriptions when the output prints them
+    columns = constants.SESSIONS_DISPLAY_COLS
+
+    if shard_paths:
+        if limit is not None:
+            raise ValueError("--limit and --after cannot be combined with --shard.")
+
+        if output_format != "table":
+            columns = constants.SESSIONS_COLS
+
+        print_lookup_result(sharded_lookup(predicate_groups, list_shards(shard_paths), columns=columns), output_format)
+        return
+
+    tables = connect_tables(db_name=db_name)
+    next_cursor = None
+
+    if limit is not None:
+        query_result, next_cursor = cached_page(predicate_groups, limit, after, tables, columns)
+    elif is_compound_query(cmdline):
+        query_result = cached_compound_lookup(predicate_groups, tables, columns)
+    else:
+        query_result = cached_lookup(lookup_dict, tables, columns)
+
+    if output_format != "table":
+        load_descriptions(query_result, tables)
 
     # format and print the query to the console
-    print_query_result(query_result)
+    print_lookup_result(query_result, output_format)
+
+    if next_cursor is not None:
+        print("More results: add --after {} to see the next page".format(next_cursor))
+
+
+
+def main():
+    cmdline, profile, slow_query_ms, slow_query_log = parse_profile_options(sys.argv)
+
+    if profile:
+        db_table.profiler = QueryProfiler(slow_query_ms, slow_query_log)
+
+    try:
+        run_lookup(cmdline)
+    finally:
+        # keep the report apart from the result, which may be JSON
+        if profile:
+            print_report(db_table.profiler.report(), file=sys.stderr)
 
 
 
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+# for method typing
+from typing import Dict, List, Tuple
+
+# to find the range of keys starting with a prefix
+from bisect import bisect_left
+
+# to rank the completions of a prefix
+import heapq
+
+# python module for constants
+import agenda_constants as constants
+
+"""
+This module completes speaker names, session titles and locations as they are typed.
+import_agenda.py stores every name under one key per word it contains, sorted by key. The keys starting with
+a prefix are then a contiguous range of the sorted keys, found with two binary searches.
+"""
+
+# sorts after every character a key may contain, closes the range of keys starting with a prefix
+PREFIX_RANGE_END = '\U0010ffff'
+
+
+def normalize_key(value: str) -> str:
+    """
+    Normalizes a name or a typed prefix so completions ignore case and repeated whitespace.
+    """
+    return " ".join(value.casefold().split())
+
+
+def suggestion_keys(name: str) -> List[str]:
+    """
+    Lists the keys a name is completed from, the normalized name starting at each of its words.
+
+    Parameters
+    ------------
+    name: str
+        a speaker name, session title or location
+
+    Returns
+        the keys of the name, "Yuanyuan Zhou" gives ["yuanyuan zhou", "zhou"]
+    """
+    words = normalize_key(name).split(" ")
+
+    return [" ".join(words[index:]) for index in range(len(words)) if words[index]]
+
+
+class PrefixIndex():
+    """
+    Sorted keys of one kind of name, speaker, title or location, and the completions of the shortest prefixes.
+    """
+
+    def __init__(self, entries: List[Tuple[str, str, int]]) -> None:
+        """
+        Parameters
+        ------------
+        entries: List[Tuple[str, str, int]]
+            (key, name, session count) of every key, sorted by key
+        """
+
+        self.keys = [entry[0] for entry in entries]
+        self.names = [entry[1] for entry in entries]
+        self.session_counts = [entry[2] for entry in entries]
+
+        # short prefixes match most of the keys, rank them once instead of at every keystroke
+        self.precomputed = dict()
+
+        for key in self.keys:
+            for length in range(constants.PRECOMPUTED_PREFIX_LENGTH + 1):
+                prefix = key[:length]
+
+                if prefix not in self.precomputed:
+                    self.precomputed[prefix] = self.rank(prefix, constants.DEFAULT_SUGGESTIONS)
+
+    def rank(self, prefix: str, limit: int) -> List[Tuple[str, int]]:
+        """
+        Ranks the names having a key that starts with an already normalized prefix.
+        """
+
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + PREFIX_RANGE_END, start)
+
+        # a name can have several keys starting with the prefix, keep it once
+        matches = dict()
+
+        for index in range(start, end):
+            matches[self.names[index]] = self.session_counts[index]
+
+        # most sessions first, names with as many sessions in alphabetical order
+        return heapq.nsmallest(limit, matches.items(), key=lambda match: (-match[1], match[0]))
+
+    def complete(self, prefix: str, limit: int = constants.DEFAULT_SUGGESTIONS) -> List[Tuple[str, int]]:
+        """
+        Completes a typed prefix.
+
+        Parameters
+        ------------
+        prefix: str
+            the beginning of any word of the name
+        limit: int
+            maximum number of completions
+
+        Returns
+            (name, session count) of the top limit completions, most sessions first
+        """
+
+        prefix = normalize_key(prefix)
+
+        if prefix in self.precomputed and limit <= constants.DEFAULT_SUGGESTIONS:
+            return self.precomputed[prefix][:limit]
+
+        return self.rank(prefix, limit)
+
+
+def load_prefix_indexes(suggestion_rows: List[Dict[str, str]]) -> Dict[str, PrefixIndex]:
+    """
+    Builds the prefix index of every kind of name from the rows of the suggestions table.
+
+    Parameters
+    ------------
+    suggestion_rows: List[Dict[str, str]]
+        rows of the suggestions table, sorted by kind then suggestion_key
+
+    Returns
+        a dictionary mapping speaker, title and location to their prefix index
+    """
+
+    entries = {kind: [] for kind in constants.SUGGEST_COLS}
+
+    for row in suggestion_rows:
+        entries[row['kind']].append((row['suggestion_key'], row['suggestion'], row['session_count']))
+
+    return {kind: PrefixIndex(kind_entries) for kind, kind_entries in entries.items()}
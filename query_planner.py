@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+# for method typing
+from typing import Dict, List, Optional, Tuple
+
+# sqlite wrapper class
+from db_table import db_table
+
+# python modules for table definitions and constants
+import table_definitions as table_defs
+import agenda_constants as constants
+
+"""
+This module plans compound lookups made of several column=value predicates.
+Predicates are combined with AND inside a group, and groups are combined with OR.
+Each AND group is driven by its most selective indexed predicate, the remaining predicates
+are checked on the rows it returns, and the whole lookup runs as a single SQL statement.
+"""
+
+# rows a predicate is assumed to match when the database has no index statistics
+DEFAULT_PREDICATE_ROWS = 10
+
+
+class QueryPlanner():
+    """
+    Estimates how many sessions each predicate matches from the sqlite_stat1 statistics gathered by
+    import_agenda.py, and builds the SQL statement of a compound lookup.
+    """
+
+    def __init__(self, tables: Dict[str, db_table]) -> None:
+        """
+        Parameters
+        ------------
+        tables: Dict[str, db_table]
+            tables returned by lookup_agenda.connect_tables
+        """
+
+        self.sessions = tables[constants.SESSIONS_TABLE_NAME]
+        self.sessions_speakers = tables[constants.SESSIONS_SPEAKERS_TABLE_NAME]
+
+        self.index_stats = self.read_index_stats()
+
+    def read_index_stats(self) -> Dict[str, List[int]]:
+        """
+        Reads sqlite_stat1. Each index maps to [number of rows, average rows per distinct value].
+
+        Returns
+            a dictionary mapping index names to their statistics, empty if the database was never analyzed
+        """
+
+        stat_table_exists = self.sessions.select_query(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+
+        if not stat_table_exists:
+            return {}
+
+        index_stats = {}
+
+        for row in self.sessions.select_query("SELECT idx, stat FROM sqlite_stat1 WHERE idx IS NOT NULL"):
+            index_stats[row['idx']] = [int(num) for num in row['stat'].split()[:2]]
+
+        return index_stats
+
+    def estimate_rows(self, column: str) -> Tuple[bool, float]:
+        """
+        Estimates how many sessions match an equality predicate on a lookup column.
+
+        Parameters
+        ------------
+        column: str
+            one of the lookup columns in agenda_constants.LOOKUP_COLS
+
+        Returns
+            (is the predicate indexed, estimated number of matching sessions)
+        """
+
+        # a speaker name is unique, so the speaker matches as many sessions as the average speaker gives
+        if column == 'speaker':
+            index_name = self.sessions_speakers.index_name('speaker_id')
+        elif column in table_defs.sessions_indexed_cols:
+            index_name = self.sessions.index_name(column)
+        else:
+            return (False, float('inf'))
+
+        if index_name not in self.index_stats:
+            return (True, DEFAULT_PREDICATE_ROWS)
+
+        return (True, self.index_stats[index_name][-1])
+
+    def order_predicates(self, predicates: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """
+        Orders the predicates of an AND group from the most to the least selective.
+        Indexed predicates always come before unindexed ones.
+        """
+
+        def selectivity(predicate):
+            is_indexed, estimated_rows = self.estimate_rows(predicate[0])
+            return (not is_indexed, estimated_rows)
+
+        return sorted(predicates, key=selectivity)
+
+    def plan_group(self, predicates: List[Tuple[str, str]], after: Optional[int] = None, limit: Optional[int] = None) -> Tuple[str, List[str]]:
+        """
+        Builds the statement returning the session_id of every session matching all the predicates.
+
+        The driving predicate is the only one SQLite may use an index for. Session columns of the other
+        predicates are prefixed with a unary + so that SQLite checks them on the rows the driving predicate
+        returns, and the other speakers are checked with an EXISTS sub-query.
+
+        Parameters
+        ------------
+        predicates: List[Tuple[str, str]]
+            (column, value) pairs that all have to match
+        after: Optional[int]
+            only return sessions whose session_id is greater than after
+        limit: Optional[int]
+            maximum number of session ids to return, lowest session_id first
+
+        Returns
+            the SQL statement and the values to bind to its placeholders
+        """
+
+        predicates = self.order_predicates(predicates)
+        driving_column, driving_value = predicates[0]
+
+        params = [driving_value]
+
+        # speakers -> sessions_speakers -> sessions, CROSS JOIN keeps SQLite from reordering the join
+        if driving_column == 'speaker':
+            query = ("SELECT s.session_id FROM %s AS sp "
+                     "JOIN %s AS ss ON ss.speaker_id = sp.speaker_id "
+                     "CROSS JOIN %s AS s ON s.session_id = ss.session_id "
+                     "WHERE sp.speaker_name = ?") % (
+                constants.SPEAKERS_TABLE_NAME, constants.SESSIONS_SPEAKERS_TABLE_NAME, constants.SESSIONS_TABLE_NAME)
+        else:
+            query = "SELECT s.session_id FROM %s AS s WHERE s.%s = ?" % (constants.SESSIONS_TABLE_NAME, driving_column)
+
+        for column, value in predicates[1:]:
+            if column == 'speaker':
+                query += (" AND EXISTS (SELECT 1 FROM %s AS other_ss JOIN %s AS other_sp ON other_sp.speaker_id = other_ss.speaker_id "
+                          "WHERE other_ss.session_id = s.session_id AND other_sp.speaker_name = ?)") % (
+                    constants.SESSIONS_SPEAKERS_TABLE_NAME, constants.SPEAKERS_TABLE_NAME)
+            else:
+                query += " AND +s.%s = ?" % column
+
+            params.append(value)
+
+        # the driving index stores session_id after the indexed value, so SQLite can seek straight to the cursor
+        if after is not None:
+            query += " AND s.session_id > ?"
+            params.append(after)
+
+        if limit is not None:
+            query = "SELECT session_id FROM (%s ORDER BY s.session_id LIMIT ?)" % query
+            params.append(limit)
+
+        return (query, params)
+
+    def plan(self, predicate_groups: List[List[Tuple[str, str]]], after: Optional[int] = None, limit: Optional[int] = None,
+             columns: Tuple[str, ...] = constants.SESSIONS_COLS) -> Tuple[str, List[str]]:
+        """
+        Builds the single statement of a compound lookup. It returns the matching sessions and the
+        subsessions of every matching session, once each and in display order.
+
+        When paginating, only the first limit matching sessions after the cursor are read, so a page costs
+        O(limit) whatever the total number of matches. Each row then also carries a "matched" column telling
+        matching sessions (1) apart from subsessions that are only returned along with their parent (0).
+
+        Parameters
+        ------------
+        predicate_groups: List[List[Tuple[str, str]]]
+            groups of (column, value) predicates. Predicates of a group are ANDed, groups are ORed
+        after: Optional[int]
+            keyset cursor, only sessions whose session_id is greater than after can match
+        limit: Optional[int]
+            maximum number of matching sessions to read
+        columns: Tuple[str, ...]
+            the sessions columns to return, they have to include session_id and parent_session_id when paginating
+
+        Returns
+            the SQL statement and the values to bind to its placeholders
+        """
+
+        group_queries = []
+        params = []
+
+        for predicates in predicate_groups:
+            group_query, group_params = self.plan_group(predicates, after, limit)
+            group_queries.append(group_query)
+            params += group_params
+
+        hits_query = " UNION ".join(group_queries)
+
+        if limit is not None:
+            hits_query = "SELECT session_id FROM (%s) ORDER BY session_id LIMIT ?" % hits_query
+            params.append(limit)
+
+        columns_query_string = ", ".join(["s.%s AS %s" % (column, column) for column in columns])
+        subsession_columns_query_string = ", ".join(["sub.%s" % column for column in columns])
+        subsession_filter = ""
+
+        # flag the matching rows, and keep the subsession half from repeating the subsessions that matched
+        if limit is not None:
+            columns_query_string += ", 1 AS matched"
+            subsession_columns_query_string += ", 0 AS matched"
+            subsession_filter = "AND sub.session_id NOT IN (SELECT session_id FROM hits) "
+
+        # subsessions are inserted right after their parent session, so session_id order is display order
+        # the matching sessions are read by session_id, CROSS JOIN keeps SQLite from scanning sessions against the
+        # list of hits, and the subsessions of each matching session are the range (session_id, subtree_end] of the
+        # session tree, which CROSS JOIN also reads as one rowid range scan
+        query = ("WITH hits(session_id) AS (%s) "
+                 "SELECT %s FROM hits CROSS JOIN %s AS s ON s.session_id = hits.session_id "
+                 "UNION "
+                 "SELECT %s FROM %s AS p CROSS JOIN %s AS sub ON sub.session_id > p.session_id AND sub.session_id <= p.subtree_end "
+                 "WHERE p.session_id IN (SELECT session_id FROM hits) %s"
+                 "ORDER BY session_id") % (
+            hits_query,
+            columns_query_string, constants.SESSIONS_TABLE_NAME,
+            subsession_columns_query_string, constants.SESSIONS_TABLE_NAME, constants.SESSIONS_TABLE_NAME,
+            subsession_filter)
+
+        return (query, params)
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+
+# for method typing
+from typing import Dict, List, Optional
+
+# to recognize the values of a statement
+import re
+
+# to keep the latest durations of each query shape
+from collections import deque
+import math
+
+# the profiler is shared by every thread running lookups
+import threading
+
+# the slow query log has one JSON record per line
+import json
+from datetime import datetime
+
+# to grab command line arguments
+import sys
+
+# a slow query log only exists once a statement was slow
+import os
+
+# python module for constants
+import agenda_constants as constants
+
+"""
+This module profiles the statements db_table runs. Statements are grouped by shape, the statement with its values
+replaced by ?, and each shape keeps its count, total time and 99th percentile. Statements slower than a threshold
+are written to a slow query log with their EXPLAIN QUERY PLAN, so full table scans show up before they hurt.
+
+Run it on a slow query log to print the hottest query shapes:
+    query_profiler.py slow_queries.log [--limit N]
+"""
+
+# quoted strings, numbers that are not part of a name, and lists of placeholders
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def query_shape(query: str) -> str:
+    """
+    Replaces the values of a statement with ?, so statements that only differ by their values share a shape
+    """
+
+    shape = STRING_LITERAL.sub("?", query)
+    shape = NUMBER_LITERAL.sub("?", shape)
+    shape = PLACEHOLDER_LIST.sub("(?, ...)", shape)
+
+    return " ".join(shape.split())
+
+
+def percentile(durations: List[float], fraction: float) -> float:
+    """
+    Returns the duration that fraction of the durations do not exceed, nearest rank
+    """
+
+    ordered = sorted(durations)
+
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def full_scans(plan: List[str]) -> List[str]:
+    """
+    Returns the steps of a query plan that read a whole table or index. Scans of the rows a sub-query or a
+    WITH clause produced, and of SQLite's own tables, are left out
+    """
+
+    # MATERIALIZE hits, CO-ROUTINE (subquery-1)
+    produced = [step.split(" ", 1)[1] for step in plan if step.startswith(("MATERIALIZE ", "CO-ROUTINE "))]
+
+    scans = []
+
+    for step in plan:
+        if not step.startswith("SCAN ") or step.startswith("SCAN CONSTANT ROW"):
+            continue
+
+        scanned = step[len("SCAN "):].split(" USING ")[0]
+
+        if scanned in produced or scanned.startswith(("(subquery", "sqlite_")):
+            continue
+
+        scans.append(step)
+
+    return scans
+
+
+class QueryProfiler():
+    """
+    Times the statements of db_table once it is installed as db_table.profiler. The profiler is thread-safe.
+    """
+
+    def __init__(self, slow_query_ms: float = constants.SLOW_QUERY_MS, log_filename: Optional[str] = None) -> None:
+        """
+        Parameters
+        ------------
+        slow_query_ms: float
+            statements taking at least this many milliseconds are logged with their query plan
+        log_filename: Optional[str]
+            the slow query log to append to. Slow statements are only kept in the statistics without one
+        """
+
+        self.slow_query_ms = slow_query_ms
+        self.log_filename = log_filename
+        self.lock = threading.Lock()
+
+        # shape -> [count, total milliseconds, latest durations in milliseconds]
+        self.stats = dict()
+
+    def explain(self, db_conn, query: str, params) -> List[str]:
+        """
+        Returns the steps of the query plan SQLite picks for a statement, an empty plan if it cannot be explained
+        """
+
+        try:
+            return [row[-1] for row in db_conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+        except Exception:
+            return []
+
+    def record(self, db_conn, db_name: str, query: str, params, elapsed: float) -> None:
+        """
+        Adds a statement run by db_table to the statistics of its shape, and logs it if it is slow.
+
+        Parameters
+        ------------
+        db_conn: sqlite3.Connection
+            the connection the statement ran on, slow statements are explained on it
+        db_name: str
+            the database the statement ran on
+        query: str
+            the statement
+        params: list
+            the values bound to its placeholders
+        elapsed: float
+            the seconds it took to run the statement and fetch its rows
+        """
+
+        elapsed_ms = elapsed * 1000
+        shape = query_shape(query)
+
+        with self.lock:
+            if shape not in self.stats:
+                self.stats[shape] = [0, 0.0, deque(maxlen=constants.PROFILE_SAMPLES)]
+
+            shape_stats = self.stats[shape]
+            shape_stats[0] += 1
+            shape_stats[1] += elapsed_ms
+            shape_stats[2].append(elapsed_ms)
+
+        if elapsed_ms < self.slow_query_ms or self.log_filename is None:
+            return
+
+        plan = self.explain(db_conn, query, params)
+
+        record = {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'db_name': db_name,
+            'shape': shape,
+            'query': query,
+            'elapsed_ms': round(elapsed_ms, 3),
+            'plan': plan,
+            'full_scans': full_scans(plan)
+        }
+
+        with self.lock:
+            with open(self.log_filename, "a") as log_file:
+                log_file.write(json.dumps(record) + "\n")
+
+    def report(self) -> List[Dict[str, str]]:
+        """
+        Summarizes the statements timed so far.
+
+        Returns
+            the count, total and 99th percentile milliseconds of each query shape, highest total first
+        """
+
+        with self.lock:
+            return summarize({shape: (count, total_ms, list(durations)) for shape, (count, total_ms, durations) in self.stats.items()})
+
+
+def summarize(stats: Dict[str, tuple]) -> List[Dict[str, str]]:
+    """
+    Turns the (count, total milliseconds, durations) of each shape into rows, highest total first
+    """
+
+    rows = [{
+        'shape': shape,
+        'count': count,
+        'total_ms': round(total_ms, 3),
+        'p99_ms': round(percentile(durations, 0.99), 3)
+    } for shape, (count, total_ms, durations) in stats.items()]
+
+    rows.sort(key=lambda row: row['total_ms'], reverse=True)
+
+    return rows
+
+
+def summarize_log(log_filename: str) -> List[Dict[str, str]]:
+    """
+    Summarizes the statements of a slow query log.
+
+    Parameters
+    ------------
+    log_filename: str
+        a slow query log written by QueryProfiler
+
+    Returns
+        the count, total and 99th percentile milliseconds of each query shape, highest total first, with the
+        full table scans of its latest plan. No rows if the log does not exist
+    """
+
+    stats = dict()
+    scans = dict()
+
+    # the log is only created once a statement is slow
+    if not os.path.exists(log_filename):
+        return []
+
+    with open(log_filename) as log_file:
+        for line in log_file:
+            if not line.strip():
+                continue
+
+            record = json.loads(line)
+            shape_stats = stats.setdefault(record['shape'], [0, 0.0, []])
+
+            shape_stats[0] += 1
+            shape_stats[1] += record['elapsed_ms']
+            shape_stats[2].append(record['elapsed_ms'])
+
+            scans[record['shape']] = record['full_scans']
+
+    rows = summarize(stats)
+
+    for row in rows:
+        row['full_scans'] = scans[row['shape']]
+
+    return rows
+
+
+def print_report(rows: List[Dict[str, str]], limit: int = constants.PROFILE_REPORT_SIZE, file=sys.stdout) -> None:
+    """
+    Prints the hottest query shapes, flagging the ones that read a whole table
+    """
+
+    print('{:>8} {:>12} {:>10}  {}'.format('Count', 'Total ms', 'p99 ms', 'Query shape'), file=file)
+    print("=" * 100, file=file)
+
+    for row in rows[:limit]:
+        print('{:>8} {:>12.3f} {:>10.3f}  {}'.format(row['count'], row['total_ms'], row['p99_ms'], row['shape']), file=file)
+
+        for step in row.get('full_scans', []):
+            print('{:>33}  full scan: {}'.format('', step), file=file)
+
+    print(file=file)
+
+
+def main():
+    if len(sys.argv) not in (2, 4) or (len(sys.argv) == 4 and (sys.argv[2] != "--limit" or not sys.argv[3].isdigit())):
+        raise TypeError("Please provide your report request in the following format: [slow query log] [--limit N]")
+
+    limit = int(sys.argv[3]) if len(sys.argv) == 4 else constants.PROFILE_REPORT_SIZE
+
+    rows = summarize_log(sys.argv[1])
+
+    if not rows:
+        print("No slow statements logged.")
+        return
+
+    print_report(rows, limit)
+
+
+
+if __name__ == "__main__":
+    main()
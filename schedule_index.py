@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+
+# for method typing
+from typing import Dict, List, Optional, Tuple
+
+# to parse the dates and times of the agenda
+from datetime import datetime
+from functools import lru_cache
+
+# to keep the sessions still running during a sweep
+import heapq
+
+# to search the busy intervals of a room
+from bisect import bisect_right
+
+# python module for constants
+import agenda_constants as constants
+
+"""
+This module indexes when sessions take place, to find the rooms booked twice and the speakers scheduled in
+overlapping sessions, and the rooms free at a given time. Sessions are converted to [start, end) intervals in
+minutes, grouped by location and by speaker, and each group is swept once in start order, so a full conflict report
+costs O(n log n) plus the conflicts found. The bookings of each room are also merged into disjoint busy intervals,
+so whether a room is free is answered with a binary search.
+"""
+
+MINUTES_PER_DAY = 24 * 60
+
+
+@lru_cache(maxsize=None)
+def parse_date(date: str) -> Optional[int]:
+    """
+    Converts an agenda date, e.g. 06/16/2018, to a day number. None if the date cannot be parsed
+    """
+
+    try:
+        return datetime.strptime(date, constants.AGENDA_DATE_FORMAT).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=None)
+def parse_time(time: str) -> Optional[int]:
+    """
+    Converts an agenda time, e.g. 08:30 AM, to minutes after midnight. None if the time cannot be parsed
+    """
+
+    try:
+        parsed_time = datetime.strptime(time, constants.AGENDA_TIME_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+    return parsed_time.hour * 60 + parsed_time.minute
+
+
+def session_interval(date: str, time_start: str, time_end: str) -> Optional[Tuple[int, int]]:
+    """
+    Converts the date and times of a session to a [start, end) interval in minutes.
+
+    Returns
+        (start, end), None if the session has no valid date and times
+    """
+
+    day = parse_date(date)
+    start = parse_time(time_start)
+    end = parse_time(time_end)
+
+    if day is None or start is None or end is None:
+        return None
+
+    # a session ending before it starts runs past midnight
+    if end < start:
+        end += MINUTES_PER_DAY
+
+    return (day * MINUTES_PER_DAY + start, day * MINUTES_PER_DAY + end)
+
+
+def format_minutes(minutes: int) -> Tuple[str, str]:
+    """
+    Converts minutes returned by session_interval back to an agenda date and time.
+
+    Returns
+        (date, time), e.g. ("06/16/2018", "08:30 AM")
+    """
+
+    day, minute_of_day = divmod(minutes, MINUTES_PER_DAY)
+    hour, minute = divmod(minute_of_day, 60)
+
+    date = datetime.fromordinal(day).strftime(constants.AGENDA_DATE_FORMAT)
+    time = datetime(2000, 1, 1, hour, minute).strftime(constants.AGENDA_TIME_FORMAT)
+
+    return (date, time)
+
+
+def merge_intervals(intervals: List[Tuple[int, int, int]]) -> Tuple[List[int], List[int]]:
+    """
+    Merges overlapping and back to back intervals into disjoint busy intervals.
+
+    Parameters
+    ------------
+    intervals: List[Tuple[int, int, int]]
+        (start, end, session_id) of every interval, sorted by start
+
+    Returns
+        the starts and the ends of the busy intervals, both sorted
+    """
+
+    starts = []
+    ends = []
+
+    for start, end, session_id in intervals:
+        if ends and start <= ends[-1]:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+
+    return (starts, ends)
+
+
+def find_overlaps(intervals: List[Tuple[int, int, int]]) -> List[Tuple[int, int]]:
+    """
+    Sweeps intervals in start order and pairs every interval with the intervals still running when it starts.
+    Sessions ending when another one starts do not overlap.
+
+    Parameters
+    ------------
+    intervals: List[Tuple[int, int, int]]
+        (start, end, session_id) of every interval, sorted by start
+
+    Returns
+        (session_id, session_id) of every overlapping pair, the session starting first on the left
+    """
+
+    overlaps = []
+
+    # (end, session_id) of the intervals started and not yet ended
+    running = []
+
+    for start, end, session_id in intervals:
+        while running and running[0][0] <= start:
+            heapq.heappop(running)
+
+        for running_end, running_session_id in running:
+            overlaps.append((running_session_id, session_id))
+
+        if end > start:
+            heapq.heappush(running, (end, session_id))
+
+    return overlaps
+
+
+class ScheduleIndex():
+    """
+    Session intervals sorted by start, grouped by location and by speaker.
+    """
+
+    def __init__(self, sessions: List[Dict[str, str]], sessions_speakers: List[Dict[str, str]]) -> None:
+        """
+        Parameters
+        ------------
+        sessions: List[Dict[str, str]]
+            rows of the sessions table, with their session_id, subtree_end, title, location, date,
+            time_start and time_end columns
+        sessions_speakers: List[Dict[str, str]]
+            rows of the sessions_speakers table joined with the speaker_name of each speaker
+        """
+
+        self.sessions = dict()
+        self.intervals = dict()
+
+        for row in sessions:
+            interval = session_interval(row['date'], row['time_start'], row['time_end'])
+
+            # sessions without a schedule cannot conflict
+            if interval is None:
+                continue
+
+            self.sessions[row['session_id']] = row
+            self.intervals[row['session_id']] = interval
+
+        # a location can only be booked twice by sessions that say where they take place
+        location_intervals = dict()
+
+        for session_id, row in self.sessions.items():
+            if row['location']:
+                location_intervals.setdefault(row['location'], []).append(self.interval_entry(session_id))
+
+        speaker_intervals = dict()
+        self.speaker_names = dict()
+
+        for row in sessions_speakers:
+            if row['session_id'] in self.intervals:
+                speaker_intervals.setdefault(row['speaker_id'], []).append(self.interval_entry(row['session_id']))
+                self.speaker_names[row['speaker_id']] = row['speaker_name']
+
+        self.location_intervals = {location: sorted(entries) for location, entries in location_intervals.items()}
+        self.speaker_intervals = {speaker_id: sorted(entries) for speaker_id, entries in speaker_intervals.items()}
+
+        # (starts, ends) of the disjoint busy intervals of every room
+        self.busy_intervals = {location: merge_intervals(entries) for location, entries in self.location_intervals.items()}
+
+    def interval_entry(self, session_id: int) -> Tuple[int, int, int]:
+        """
+        Returns the (start, end, session_id) entry of a session in the sorted interval arrays
+        """
+
+        start, end = self.intervals[session_id]
+        return (start, end, session_id)
+
+    def is_nested(self, session_id: int, other_session_id: int) -> bool:
+        """
+        Tells if one of the sessions is a subsession of the other one, a session overlaps its own subsessions
+        """
+
+        first, second = sorted((session_id, other_session_id))
+
+        return second <= self.sessions[first]['subtree_end']
+
+    def find_conflicts(self, grouped_intervals: Dict, conflict: str, resource_names: Dict) -> List[Dict[str, str]]:
+        """
+        Sweeps each group of intervals and describes the overlapping sessions that are not nested.
+        """
+
+        conflicts = []
+
+        for resource, intervals in grouped_intervals.items():
+            for session_id, other_session_id in find_overlaps(intervals):
+                if self.is_nested(session_id, other_session_id):
+                    continue
+
+                session = self.sessions[session_id]
+                other_session = self.sessions[other_session_id]
+
+                conflicts.append({
+                    'conflict': conflict,
+                    'resource': resource_names.get(resource, resource),
+                    'date': session['date'],
+                    'session_id': session_id,
+                    'title': session['title'],
+                    'time_start': session['time_start'],
+                    'time_end': session['time_end'],
+                    'other_session_id': other_session_id,
+                    'other_title': other_session['title'],
+                    'other_time_start': other_session['time_start'],
+                    'other_time_end': other_session['time_end']
+                })
+
+        # report the conflicts in schedule order
+        conflicts.sort(key=lambda row: (self.intervals[row['session_id']], self.intervals[row['other_session_id']], row['resource']))
+
+        return conflicts
+
+    def room_availability(self, location: str, start: int, end: int) -> Tuple[bool, int, Optional[int]]:
+        """
+        Tells if a room is free over [start, end), and finds its next free slot as long as the window otherwise.
+        Costs one binary search when the room is free, plus one step per back to back booking when it is not.
+
+        Parameters
+        ------------
+        location: str
+            the room
+        start: int
+            the start of the window, in minutes as returned by session_interval
+        end: int
+            the end of the window, equal to start to ask if the room is free at that minute
+
+        Returns
+            (is the room free over the window, start of its next free slot, end of that free slot or None if the
+            room is never booked again)
+        """
+
+        starts, ends = self.busy_intervals[location]
+
+        # the first busy interval still running at start, busy intervals are disjoint so their ends are sorted too
+        index = bisect_right(ends, start)
+        free_from = start
+
+        # skip the busy intervals the window does not fit before
+        while index < len(starts) and starts[index] < free_from + max(end - start, 1):
+            free_from = max(free_from, ends[index])
+            index += 1
+
+        free_until = starts[index] if index < len(starts) else None
+
+        return (free_from == start, free_from, free_until)
+
+    def free_rooms(self, start: int, end: int) -> List[Dict[str, str]]:
+        """
+        Lists every room with its availability over [start, end).
+
+        Parameters
+        ------------
+        start: int
+            the start of the window, in minutes as returned by session_interval
+        end: int
+            the end of the window, equal to start to ask which rooms are free at that minute
+
+        Returns
+            a dictionary for each room, free rooms first. The free slot of each room is given as "date time"
+        """
+
+        rooms = []
+
+        for location in sorted(self.busy_intervals):
+            is_free, free_from, free_until = self.room_availability(location, start, end)
+
+            rooms.append({
+                'location': location,
+                'free': is_free,
+                'free_from': " ".join(format_minutes(free_from)),
+                'free_until': " ".join(format_minutes(free_until)) if free_until is not None else None
+            })
+
+        rooms.sort(key=lambda room: not room['free'])
+
+        return rooms
+
+    def room_conflicts(self) -> List[Dict[str, str]]:
+        """
+        Finds the locations booked by overlapping sessions.
+
+        Returns
+            a dictionary describing each pair of conflicting sessions, their location is the resource
+        """
+
+        return self.find_conflicts(self.location_intervals, 'room', {})
+
+    def speaker_conflicts(self) -> List[Dict[str, str]]:
+        """
+        Finds the speakers scheduled in overlapping sessions.
+
+        Returns
+            a dictionary describing each pair of conflicting sessions, their speaker_name is the resource
+        """
+
+        return self.find_conflicts(self.speaker_intervals, 'speaker', self.speaker_names)
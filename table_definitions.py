@@ -18,6 +18,11 @@ speakers_dict = {
 # sessions table definition
 #
 # contains records of sessions and subsessions
+# description_summary is the description shortened for display, so lookups do not have to read full descriptions
+# subtree_end materializes the session tree as a nested set: subsessions are stored right after their parent session,
+#   so a session and its subsessions are the contiguous session_id range [session_id, subtree_end]
+# description is the last column: sqlite reads the columns of a row in order, and a long description spilled to
+#   overflow pages would otherwise be read to reach any column stored after it
 # contains foreign key
 #   - parent_session_id : if the record is a subsession, this id references a session in the table. Can be NULL
 #
@@ -30,6 +35,8 @@ sessions_dict = {
     "time_end": "text NOT NULL",
     "session_type": "text NOT NULL",
     "title": "text NOT NULL",
+    "description_summary": "text",
+    "subtree_end": "integer",
     "description": "text"
 }
 
@@ -42,4 +49,43 @@ sessions_dict = {
 sessions_speakers_dict = {
     "session_id": "integer",
     "speaker_id": "integer",
-}
\ No newline at end of file
+}
+
+#
+# suggestions table definition
+#
+# prefix index for type-ahead over speaker names, session titles and locations, built by import_agenda.py
+# every name is stored once per word it contains, keyed by the casefolded name starting at that word,
+# so "Yuanyuan Zhou" is suggested for both "yuan" and "zho". rows are inserted sorted by (kind, suggestion_key)
+# session_count ranks the suggestions
+#
+suggestions_dict = {
+    "kind": "text NOT NULL",
+    "suggestion_key": "text NOT NULL",
+    "suggestion": "text NOT NULL",
+    "session_count": "integer NOT NULL"
+}
+
+#
+# indexed columns
+#
+# created by import_agenda.py once the tables are populated
+# lookups filter on these columns. subsessions are read through the session tree, see subtree_end
+#
+sessions_indexed_cols = ("date", "time_start", "time_end", "title", "location")
+sessions_speakers_indexed_cols = ("speaker_id", "session_id")
+
+# one-off completions read the range of keys starting with a prefix, see lookup_agenda.select_suggestions
+suggestions_indexed_cols = (("kind", "suggestion_key"),)
+
+#
+# import_metadata table definition
+#
+# key/value rows describing the import that produced the database
+# import_agenda.py bumps the "import_generation" row and writes a new "import_id" on every import so that cached
+# lookup results can be invalidated
+#
+import_metadata_dict = {
+    "meta_key": "text PRIMARY KEY",
+    "meta_value": "text"
+}
@@ -1,19 +1,58 @@
 #!/usr/bin/env python3
 
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
 import unittest
+from unittest import mock
 import lookup_agenda as lookup
+import schedule_index
+import query_profiler
+import async_lookup_agenda as async_lookup
+import import_agenda
 import agenda_constants as constants
+import table_definitions as table_defs
+from db_table import db_table
+
+# the columnar export is optional, its tests only run when numpy is installed
+try:
+    import numpy as np
+    import agenda_analytics
+except ImportError:
+    agenda_analytics = None
 
 """
 This program checks if a query returned by lookup_agenda.py is correct.
 It does so by checking if the the session data returned matches the desired rows.
 
-Before running this file, check to see if "interview_test.db" already exists. If it does not,
-run import_agenda.py to create the database.
+The test classes import agenda.xls in memory before running, no pre-built database is needed.
 
 """
 
-class TestLookupAgenda(unittest.TestCase):
+class ImportedAgenda():
+    """
+    Imports agenda.xls in memory once for the tests of a class. Tests that need a database file,
+    such as the query cache or the sharded lookups, use a backup of it.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.agenda_database = import_agenda.build_agenda([("agenda.xls", 0)])
+        cls.tables = lookup.connect_tables(cls.agenda_database.sessions.db_conn, ":memory:")
+
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        cls.database_filename = os.path.join(cls.temp_dir.name, "agenda.db")
+        cls.agenda_database.backup(cls.database_filename)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.agenda_database.close()
+        cls.temp_dir.cleanup()
+
+
+class TestLookupAgenda(ImportedAgenda, unittest.TestCase):
 
     def test_parse(self):
         """
@@ -63,7 +102,7 @@ class TestLookupAgenda(unittest.TestCase):
         for index, lookup_dict in enumerate(lookup_dicts):
             print("testing {}".format(lookup_dict))
 
-            query_result = lookup.select_from_speakers_column(lookup_dict)
+            query_result = lookup.select_from_speakers_column(lookup_dict, self.tables)
 
             # extract all the locations from the query
             locations = [row['location'] for row in query_result]
@@ -91,7 +130,7 @@ class TestLookupAgenda(unittest.TestCase):
         # extract all the locations from the query
         for index, date in enumerate(date_dicts):
             print("testing {}".format(date))
-            self.assertEqual(len(lookup.select_from_sessions_columns(date)), number_of_rows_dates[index])
+            self.assertEqual(len(lookup.select_from_sessions_columns(date, self.tables)), number_of_rows_dates[index])
         
         print("****** PASSED *******\n")
 
@@ -119,7 +158,7 @@ class TestLookupAgenda(unittest.TestCase):
         # extract all the locations from the query
         for index, time_dict in enumerate(time_dicts):
             print("testing {}".format(time_dict))
-            self.assertEqual(len(lookup.select_from_sessions_columns(time_dict)), time_dicts_lengths[index])
+            self.assertEqual(len(lookup.select_from_sessions_columns(time_dict, self.tables)), time_dicts_lengths[index])
 
         print("****** PASSED ******\n")
 
@@ -154,7 +193,7 @@ class TestLookupAgenda(unittest.TestCase):
             print("testing {}".format(title_dict))
 
             # extract all the locations from the query
-            query_result = lookup.select_from_sessions_columns(title_dict)
+            query_result = lookup.select_from_sessions_columns(title_dict, self.tables)
             locations = [row['location'] for row in query_result]
 
             self.assertEqual(locations, title_locations[index])
@@ -197,12 +236,695 @@ class TestLookupAgenda(unittest.TestCase):
             print("Testing {}".format(descriptions[index][:10] + " ..."))
 
             # extract all the locations from the query
-            query_result = lookup.select_from_sessions_columns(desc_dict)
+            query_result = lookup.select_from_sessions_columns(desc_dict, self.tables)
             locations = [row['location'] for row in query_result]
 
             self.assertEqual(locations, description_locations[index])
 
         print("******* PASSED *******\n")
 
+    def test_query_cache(self):
+        """
+        This tests if repeated lookups are answered from the query cache without running the queries again,
+        and if cached results are dropped once the database is re-imported.
+        """
+
+        print("******* TESTING QUERY CACHE *******")
+
+        lookup.query_cache.clear()
+        lookup_dict = {"location": "Coral Lounge"}
+        tables = lookup.connect_tables(db_name=self.database_filename)
+        expected_result = lookup.select_from_sessions_columns(lookup_dict, self.tables)
+        self.assertEqual(len(expected_result), 7)
+
+        with mock.patch.object(lookup, "select_from_sessions_columns", wraps=lookup.select_from_sessions_columns) as select_mock:
+            self.assertEqual(lookup.cached_lookup(lookup_dict, tables), expected_result)
+            self.assertEqual(lookup.cached_lookup(lookup_dict, tables), expected_result)
+            self.assertEqual(select_mock.call_count, 1)
+
+            # simulate a re-import by changing the import id, then restore it
+            import_id = lookup.get_import_id(self.database_filename)
+            metadata = db_table(constants.IMPORT_METADATA_TABLE_NAME, table_defs.import_metadata_dict, db_name=self.database_filename)
+
+            try:
+                metadata.update({"meta_value": "reimported"}, {"meta_key": constants.IMPORT_ID_KEY})
+                self.assertEqual(lookup.cached_lookup(lookup_dict, tables), expected_result)
+                self.assertEqual(select_mock.call_count, 2)
+            finally:
+                metadata.update({"meta_value": import_id}, {"meta_key": constants.IMPORT_ID_KEY})
+                metadata.close()
+
+        tables[constants.SESSIONS_TABLE_NAME].close()
+
+        # the least recently used entry is evicted once the cache is full
+        small_cache = lookup.QueryCache(2)
+        small_cache.put(("date", "06/16/2018"), [], self.database_filename)
+        small_cache.put(("date", "06/17/2018"), [], self.database_filename)
+        small_cache.get(("date", "06/16/2018"), self.database_filename)
+        small_cache.put(("date", "06/18/2018"), [], self.database_filename)
+
+        self.assertEqual(small_cache.get(("date", "06/17/2018"), self.database_filename), None)
+        self.assertEqual(small_cache.get(("date", "06/16/2018"), self.database_filename), [])
+
+        # reading the generation of a database that was never imported does not write to it
+        with tempfile.TemporaryDirectory() as temp_dir:
+            database_filename = os.path.join(temp_dir, "importing.db")
+            self.assertEqual(lookup.get_import_generation(database_filename), 0)
+            self.assertFalse(os.path.exists(database_filename))
+
+            db_conn = sqlite3.connect(database_filename)
+            db_conn.execute("CREATE TABLE sessions (session_id INTEGER PRIMARY KEY)")
+            self.assertEqual(lookup.get_import_generation(database_filename), 0)
+            self.assertEqual(db_conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall(), [("sessions",)])
+            db_conn.close()
+
+        # deleting the database file starts the generation over, the cache still sees the new import
+        with tempfile.TemporaryDirectory() as temp_dir:
+            database_filename = os.path.join(temp_dir, "reset.db")
+            self.agenda_database.backup(database_filename)
+            tables = lookup.connect_tables(db_name=database_filename)
+            self.assertEqual(len(lookup.cached_lookup(lookup_dict, tables)), 7)
+            tables[constants.SESSIONS_TABLE_NAME].close()
+
+            os.remove(database_filename)
+            reimported = import_agenda.build_agenda([("agenda.xls", 0)], database_filename)
+            reimported.sessions.db_conn.execute("DELETE FROM %s WHERE location = ?" % constants.SESSIONS_TABLE_NAME, ["Coral Lounge"])
+            reimported.sessions.db_conn.commit()
+            reimported.close()
+
+            self.assertEqual(lookup.get_import_generation(database_filename), 1)
+
+            tables = lookup.connect_tables(db_name=database_filename)
+            self.assertEqual(lookup.cached_lookup(lookup_dict, tables), [])
+            tables[constants.SESSIONS_TABLE_NAME].close()
+
+        print("******* PASSED *******\n")
+
+    def test_compound_lookup(self):
+        """
+        This tests if compound lookups are parsed correctly, return the same rows as the single column lookups
+        for a single predicate, and combine predicates with AND / OR.
+        """
+
+        print("******* TESTING COMPOUND LOOKUPS *******")
+
+        self.assertEqual(
+            lookup.parse_compound_query(['lookup_agenda.py', 'speaker=Shan', 'Lu', 'AND', 'date=06/18/2018', 'or', 'location=Coral 2']),
+            [[("speaker", "Shan Lu"), ("date", "06/18/2018")], [("location", "Coral 2")]]
+        )
+
+        with self.assertRaises(ValueError):
+            lookup.parse_compound_query(['lookup_agenda.py', 'room=Coral 2'])
+
+        with self.assertRaises(TypeError):
+            lookup.parse_compound_query(['lookup_agenda.py', 'date=06/18/2018', 'AND'])
+
+        # a single predicate returns the same rows as the single column lookups
+        for lookup_dict in ({"date": "06/17/2018"}, {"time_end": "02:50 PM"}, {"title": "Session 7A: Software reliability and testing II"}):
+            column, value = next(iter(lookup_dict.items()))
+            self.assertEqual(lookup.select_compound([[(column, value)]], self.tables), lookup.select_from_sessions_columns(lookup_dict, self.tables))
+
+        for speaker in ("Carl A. Waldspurger", "Keshav Pingali", "Luis Ceze"):
+            self.assertEqual(lookup.select_compound([[("speaker", speaker)]], self.tables),
+                             lookup.select_from_speakers_column({"speaker_name": speaker}, self.tables))
+
+        self.assertEqual(len(lookup.select_compound([[("speaker", "Shan Lu"), ("date", "06/18/2018")]], self.tables)), 4)
+        self.assertEqual(lookup.select_compound([[("speaker", "Shan Lu"), ("date", "06/17/2018")]], self.tables), [])
+
+        both_speakers = lookup.select_compound([[("speaker", "Guruduth Banavar")], [("speaker", "Shan Lu")]], self.tables)
+        self.assertEqual(len(both_speakers), 6)
+        self.assertEqual([row['session_id'] for row in both_speakers], sorted(row['session_id'] for row in both_speakers))
+
+        print("******* PASSED *******\n")
+
+    def test_pagination(self):
+        """
+        This tests if paging through a lookup returns every row of the lookup once, in order,
+        without splitting a session from its subsessions.
+        """
+
+        print("******* TESTING PAGINATION *******")
+
+        self.assertEqual(lookup.parse_page_options(['lookup_agenda.py', 'date', '--limit', '5', '06/17/2018']), (['lookup_agenda.py', 'date', '06/17/2018'], 5, None))
+        self.assertEqual(lookup.parse_page_options(['lookup_agenda.py', 'date', '06/17/2018', '--after', '23']), (['lookup_agenda.py', 'date', '06/17/2018'], constants.DEFAULT_PAGE_SIZE, 23))
+
+        with self.assertRaises(ValueError):
+            lookup.parse_page_options(['lookup_agenda.py', 'date', '06/17/2018', '--limit', 'ten'])
+
+        predicate_groups_list = [
+            [[("date", "06/17/2018")]],
+            [[("time_end", "02:50 PM")]],
+            [[("speaker", "Keshav Pingali")]],
+            [[("location", "Coral 2")], [("speaker", "Shan Lu")]],
+            # the matching subsessions of session 55 are returned with it, nothing matches after them
+            [[("title", "Session 7A: Software reliability and testing II")], [("location", "Coral 1"), ("date", "06/18/2018")]]
+        ]
+
+        for predicate_groups in predicate_groups_list:
+            full_result = lookup.select_compound(predicate_groups, self.tables)
+
+            for limit in (1, 3, 8):
+                pages = []
+                page, next_cursor = lookup.select_page(predicate_groups, limit, None, self.tables)
+                pages.append(page)
+
+                while next_cursor is not None:
+                    page, next_cursor = lookup.select_page(predicate_groups, limit, next_cursor, self.tables)
+                    pages.append(page)
+
+                self.assertEqual([row for page in pages for row in page], full_result)
+
+                # a cursor is only handed out when there is something left to page through
+                self.assertTrue(all(pages))
+
+                for page in pages:
+                    # subsessions are never separated from their parent session
+                    if page and page[0]['session_type'] != 'Session':
+                        self.assertNotIn(page[0]['parent_session_id'], [row['session_id'] for row in full_result])
+
+                    # a page only goes over the limit when a single session and its subsessions do not fit
+                    if len(page) > limit:
+                        self.assertTrue(all(row['parent_session_id'] == page[0]['session_id'] for row in page[1:]))
+
+        # keyset pagination of a single table
+        sessions = self.tables[constants.SESSIONS_TABLE_NAME]
+        all_ids = [row['session_id'] for row in sessions.select(['session_id'], {'date': '06/16/2018'}, order_by='session_id')]
+        first_page = sessions.select(['session_id'], {'date': '06/16/2018'}, order_by='session_id', limit=10)
+        second_page = sessions.select(['session_id'], {'date': '06/16/2018'}, order_by='session_id', after=first_page[-1]['session_id'], limit=10)
+
+        self.assertEqual([row['session_id'] for row in first_page + second_page], all_ids[:20])
+
+        print("******* PASSED *******\n")
+
+    def test_session_tree(self):
+        """
+        This tests if the session tree materialized at import spans every session and exactly its subsessions
+        """
+
+        print("******* TESTING SESSION TREE *******")
+
+        rows = self.tables[constants.SESSIONS_TABLE_NAME].select(['session_id', 'parent_session_id', 'subtree_end'], order_by='session_id')
+        self.assertEqual(len(rows), 64)
+
+        for row in rows:
+            subsession_ids = [sub['session_id'] for sub in rows if sub['parent_session_id'] == row['session_id']]
+            self.assertEqual(list(range(row['session_id'] + 1, row['subtree_end'] + 1)), subsession_ids)
+
+        print("******* PASSED *******\n")
+
+    def test_display_columns(self):
+        """
+        This tests if lookups projected on the display columns read the precomputed summary instead of the description,
+        and if full descriptions are loaded back for the outputs that need them.
+        """
+
+        print("******* TESTING DISPLAY COLUMNS *******")
+
+        lookup_dict = {"date": "06/17/2018"}
+        full_result = lookup.select_from_sessions_columns(lookup_dict, self.tables)
+        display_result = lookup.select_from_sessions_columns(lookup_dict, self.tables, constants.SESSIONS_DISPLAY_COLS)
+
+        self.assertEqual([row['session_id'] for row in display_result], [row['session_id'] for row in full_result])
+
+        for full_row, display_row in zip(full_result, display_result):
+            self.assertNotIn('description', display_row)
+            self.assertEqual(display_row['description_summary'], lookup.shorten_string(full_row['description'], constants.DESCRIPTION_DISPLAY_WIDTH))
+
+        # display lookups never have to step over a description to read the columns stored after it
+        columns = [row[1] for row in self.tables[constants.SESSIONS_TABLE_NAME].db_conn.execute("PRAGMA table_info(sessions)")]
+        self.assertEqual(columns[-1], 'description')
+
+        lookup.load_descriptions(display_result, self.tables)
+        self.assertEqual([row['description'] for row in display_result], [row['description'] for row in full_result])
+
+        print("******* PASSED *******\n")
+
+    def test_suggest(self):
+        """
+        This tests if names are completed from the beginning of any of their words, ignoring case,
+        and ranked by number of sessions.
+        """
+
+        print("******* TESTING SUGGEST *******")
+
+        self.assertEqual(lookup.suggest("speaker", "zho", 1, self.tables), [("Yuanyuan Zhou", 2)])
+        self.assertEqual(lookup.suggest("speaker", "YUANYUAN Z", tables=self.tables), [("Yuanyuan Zhou", 2)])
+        self.assertEqual(lookup.suggest("location", "coral", 1, self.tables), [("Coral Lounge", 7)])
+        self.assertEqual(lookup.suggest("title", "no session has this title", tables=self.tables), [])
+
+        # short prefixes are answered from the precomputed rankings, they have to agree with a full ranking
+        location_index = lookup.get_prefix_indexes(self.tables)["location"]
+        self.assertEqual(location_index.complete("r", 5), location_index.rank("r", 5))
+
+        suggestions = lookup.suggest("speaker", "", constants.DEFAULT_SUGGESTIONS, self.tables)
+        counts = [count for name, count in suggestions]
+        self.assertEqual(len(suggestions), constants.DEFAULT_SUGGESTIONS)
+        self.assertEqual(counts, sorted(counts, reverse=True))
+
+        # one-off completions read the range of matching keys and rank them like the prefix index
+        for kind, prefix, limit in (("speaker", "zho", 1), ("speaker", "", 10), ("location", "CORAL", 5), ("title", "session 7", 3), ("title", "zzz", 5)):
+            self.assertEqual(lookup.select_suggestions(kind, prefix, limit, self.tables), lookup.suggest(kind, prefix, limit, self.tables))
+
+        with mock.patch.object(lookup, "read_prefix_indexes") as read_prefix_indexes:
+            lookup.select_suggestions("speaker", "zho", 1, self.tables)
+            read_prefix_indexes.assert_not_called()
+
+        plan = [row[-1] for row in self.tables[constants.SESSIONS_TABLE_NAME].db_conn.execute(
+            "EXPLAIN QUERY PLAN SELECT suggestion FROM suggestions WHERE kind = ? AND suggestion_key >= ? AND suggestion_key < ? || char(1114111)",
+            ["speaker", "zho", "zho"])]
+        self.assertEqual(query_profiler.full_scans(plan), [])
+
+        with self.assertRaises(ValueError):
+            lookup.parse_suggest_command(["lookup_agenda.py", "suggest", "description", "cache"])
+
+        print("******* PASSED *******\n")
+
+    def test_conflicts(self):
+        """
+        This tests if overlapping sessions in the same room or with the same speaker are reported,
+        but not back to back sessions or a session and its own subsessions.
+        """
+
+        print("******* TESTING CONFLICTS *******")
+
+        # (start, end, session_id), 2 starts when 1 ends, 3 overlaps both
+        intervals = [(0, 30, 1), (20, 60, 3), (30, 60, 2)]
+        self.assertEqual(schedule_index.find_overlaps(intervals), [(1, 3), (3, 2)])
+
+        sessions = [
+            {'session_id': 1, 'subtree_end': 2, 'title': 'Session', 'location': 'Room 201', 'date': '06/16/2018', 'time_start': '10:00 AM', 'time_end': '11:00 AM'},
+            {'session_id': 2, 'subtree_end': 2, 'title': 'Talk', 'location': 'Room 201', 'date': '06/16/2018', 'time_start': '10:00 AM', 'time_end': '10:30 AM'},
+            {'session_id': 3, 'subtree_end': 3, 'title': 'Other talk', 'location': 'Room 201', 'date': '06/16/2018', 'time_start': '10:30 AM', 'time_end': '11:30 AM'}
+        ]
+        index = schedule_index.ScheduleIndex(sessions, [])
+        self.assertEqual([(row['session_id'], row['other_session_id']) for row in index.room_conflicts()], [(1, 3)])
+
+        conflicts = lookup.find_conflicts(tables=self.tables)
+        room_conflicts = [(row['resource'], row['session_id'], row['other_session_id']) for row in conflicts if row['conflict'] == 'room']
+        speaker_conflicts = [row['resource'] for row in conflicts if row['conflict'] == 'speaker']
+
+        self.assertEqual(room_conflicts, [("Coral 2", 25, 32)])
+        self.assertEqual(speaker_conflicts, ["Christoffer Dall", "Jason Nieh"])
+
+        print("******* PASSED *******\n")
+
+    def test_free_rooms(self):
+        """
+        This tests if rooms are free between their bookings, and if the next free slot skips back to back bookings.
+        """
+
+        print("******* TESTING FREE ROOMS *******")
+
+        sessions = [
+            {'session_id': 1, 'subtree_end': 1, 'title': 'Talk', 'location': 'Room 201', 'date': '06/16/2018', 'time_start': '10:00 AM', 'time_end': '10:30 AM'},
+            {'session_id': 2, 'subtree_end': 2, 'title': 'Talk', 'location': 'Room 201', 'date': '06/16/2018', 'time_start': '10:30 AM', 'time_end': '11:00 AM'},
+            {'session_id': 3, 'subtree_end': 3, 'title': 'Talk', 'location': 'Room 201', 'date': '06/16/2018', 'time_start': '11:30 AM', 'time_end': '12:00 PM'}
+        ]
+        index = schedule_index.ScheduleIndex(sessions, [])
+
+        def availability(time_start, time_end):
+            start, end = schedule_index.session_interval('06/16/2018', time_start, time_end)
+            is_free, free_from, free_until = index.room_availability('Room 201', start, end)
+            return (is_free, schedule_index.format_minutes(free_from)[1], free_until and schedule_index.format_minutes(free_until)[1])
+
+        self.assertEqual(availability('09:00 AM', '10:00 AM'), (True, '09:00 AM', '10:00 AM'))
+        self.assertEqual(availability('10:15 AM', '10:15 AM'), (False, '11:00 AM', '11:30 AM'))
+        self.assertEqual(availability('10:15 AM', '10:55 AM'), (False, '12:00 PM', None))
+
+        date, start, end = lookup.parse_free_command(["lookup_agenda.py", "free", "06/17/2018", "10:30", "AM", "11:00", "AM"])
+        rooms = {room['location']: room for room in lookup.free_rooms(start, end, self.tables)}
+
+        self.assertTrue(rooms['Coral 1']['free'])
+        self.assertFalse(rooms['Coral 2']['free'])
+        self.assertEqual(rooms['Coral 2']['free_from'], '06/17/2018 11:40 AM')
+
+        with self.assertRaises(TypeError):
+            lookup.parse_free_command(["lookup_agenda.py", "free", "06/17/2018", "noon"])
+
+        print("******* PASSED *******\n")
+
+    def test_sharded_lookup(self):
+        """
+        This tests if a sharded lookup returns the rows of every event database in order, tagged with their event
+        """
+
+        print("******* TESTING SHARDED LOOKUPS *******")
+
+        single_result = lookup.select_from_speakers_column({"speaker_name": "Carl A. Waldspurger"}, self.tables)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for shard_name in ("event_b", "event_a"):
+                shutil.copy(self.database_filename, os.path.join(temp_dir, shard_name + ".db"))
+
+            db_names = lookup.list_shards([temp_dir])
+            self.assertEqual([lookup.get_shard_name(db_name) for db_name in db_names], ["event_a", "event_b"])
+
+            sharded_result = lookup.sharded_lookup([[("speaker", "Carl A. Waldspurger")]], db_names)
+
+            self.assertEqual([row['shard'] for row in sharded_result], ["event_a"] * len(single_result) + ["event_b"] * len(single_result))
+
+            for row in sharded_result:
+                del row['shard']
+
+            self.assertEqual(sharded_result, single_result + single_result)
+
+            with self.assertRaises(FileNotFoundError):
+                lookup.list_shards([os.path.join(temp_dir, "missing.db")])
+
+        print("******* PASSED *******\n")
+
+
+class TestParallelImport(unittest.TestCase):
+
+    def test_merge_sources(self):
+        """
+        This tests if importing the same agenda twice in parallel keeps every session and subsession,
+        shifts the ids of the second copy and de-duplicates the speakers
+        """
+
+        print("******* TESTING PARALLEL IMPORT *******")
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            database_filename = os.path.join(temp_dir, "merged.db")
+
+            agenda_database = import_agenda.AgendaDatabase()
+            agenda_database.create_tables(database_filename)
+            import_agenda.import_in_parallel([("agenda.xls", 0), ("agenda.xls", 0)], 15, agenda_database, 2)
+            agenda_database.close()
+
+            merged_conn = sqlite3.connect(database_filename)
+            single_database = import_agenda.build_agenda([("agenda.xls", 0)])
+            single_conn = single_database.sessions.db_conn
+
+            count_query = "SELECT (SELECT count(*) FROM sessions), (SELECT count(*) FROM speakers), (SELECT count(*) FROM sessions_speakers)"
+            num_sessions, num_speakers, num_sessions_speakers = single_conn.execute(count_query).fetchone()
+            self.assertEqual(num_sessions, 64)
+
+            self.assertEqual(merged_conn.execute(count_query).fetchone(), (2 * num_sessions, num_speakers, 2 * num_sessions_speakers))
+
+            # the second copy of every subsession points at the second copy of its parent
+            parents_query = "SELECT session_id, parent_session_id FROM sessions WHERE typeof(parent_session_id) = 'integer' ORDER BY session_id"
+            single_parents = single_conn.execute(parents_query).fetchall()
+            shifted_parents = [(session_id + num_sessions, parent_id + num_sessions) for session_id, parent_id in single_parents]
+
+            self.assertEqual(merged_conn.execute(parents_query).fetchall(), single_parents + shifted_parents)
+
+            # every speaker of a session is the same in both copies
+            speakers_query = ("SELECT ss.session_id, sp.speaker_name FROM sessions_speakers AS ss "
+                              "JOIN speakers AS sp ON sp.speaker_id = ss.speaker_id ORDER BY ss.session_id, sp.speaker_name")
+            single_speakers = single_conn.execute(speakers_query).fetchall()
+            shifted_speakers = [(session_id + num_sessions, name) for session_id, name in single_speakers]
+
+            self.assertEqual(merged_conn.execute(speakers_query).fetchall(), single_speakers + shifted_speakers)
+
+            merged_conn.close()
+            single_database.close()
+
+        print("******* PASSED *******\n")
+
+
+class TestDryRunImport(unittest.TestCase):
+
+    def test_validate_agenda(self):
+        """
+        This tests if a dry run reads every row without writing, and reports the problems of a sheet with their row number.
+        """
+
+        print("******* TESTING DRY RUN IMPORT *******")
+
+        report = import_agenda.validate_agenda(("agenda.xls", 0), constants.NUM_SKIP_ROWS)
+        self.assertEqual(report['num_rows'], 64)
+        self.assertEqual(report['problems'], [])
+        self.assertEqual(set(report['stage_seconds']), set(constants.IMPORT_STAGES))
+
+        # one row too few skipped, the header is not where it is expected
+        report = import_agenda.validate_agenda(("agenda.xls", 0), constants.NUM_SKIP_ROWS - 1)
+        self.assertIn((constants.NUM_SKIP_ROWS - 1, "error"), [problem[:2] for problem in report['problems']])
+
+        rows = [
+            ['06/16/2018', '10:00 AM', '11:00 AM', 'Sub', 'Orphan talk', 'Room 201', '', ''],
+            ['06/16/2018', '11:00 AM', '12:00 PM', 'Session', 'Session 1A', 'Room 201', '', 'Shan Lu;Yuanyuan Zhou'],
+            ['06/16/2018', 'noon', '12:00 PM', 'Sub', 'Talk', 'Room 201', '', 'Shan Lu; Shan Lu']
+        ]
+        sheet = mock.Mock(nrows=len(rows), ncols=8, cell_value=lambda row, col: rows[row][col])
+
+        with mock.patch("xlrd.open_workbook") as open_workbook:
+            open_workbook.return_value.sheet_by_index.return_value = sheet
+            agenda_to_database = import_agenda.AgendaToDatabase("agenda.xls", 0)
+
+        problems = []
+        parsed_rows = list(agenda_to_database.parse_rows(problems))
+
+        self.assertEqual([session_id for session_id, row, speakers in parsed_rows], [1, 2, 3])
+        self.assertEqual(parsed_rows[2][1]['parent_session_id'], 2)
+        self.assertEqual([(row_number, severity) for row_number, severity, message in problems],
+                         [(1, "error"), (2, "warning"), (3, "warning"), (3, "warning")])
+
+        # the import refuses a broken session tree and leaves the database empty
+        agenda_to_database.create_tables(":memory:")
+
+        with self.assertRaises(ValueError):
+            agenda_to_database.populate_database()
+
+        self.assertEqual(agenda_to_database.sessions.select(['session_id']), [])
+        agenda_to_database.close()
+
+        # rows with warnings are imported as they are written, without the orphan subsession
+        del rows[0]
+        sheet.nrows = len(rows)
+
+        agenda_to_database.create_tables(":memory:")
+        agenda_to_database.populate_database()
+
+        self.assertEqual(agenda_to_database.speakers.select(['speaker_id', 'speaker_name'], order_by='speaker_id'),
+                         [{'speaker_id': 1, 'speaker_name': 'Shan Lu;Yuanyuan Zhou'}, {'speaker_id': 2, 'speaker_name': 'Shan Lu'}])
+        self.assertEqual(agenda_to_database.sessions_speakers.select(['session_id', 'speaker_id'], order_by='session_id'),
+                         [{'session_id': 1, 'speaker_id': 1}, {'session_id': 2, 'speaker_id': 2}, {'session_id': 2, 'speaker_id': 2}])
+        agenda_to_database.close()
+
+        print("******* PASSED *******\n")
+
+
+class TestQueryProfiler(ImportedAgenda, unittest.TestCase):
+
+    def test_slow_query_log(self):
+        """
+        This tests if statements are grouped by shape, and if slow statements are logged with their query plan.
+        """
+
+        print("******* TESTING QUERY PROFILER *******")
+
+        self.assertEqual(query_profiler.query_shape("SELECT title FROM sessions WHERE date = '06/17/2018' LIMIT 10"),
+                         "SELECT title FROM sessions WHERE date = ? LIMIT ?")
+        self.assertEqual(query_profiler.query_shape("SELECT title FROM sessions WHERE session_id IN (?, ?, ?)"),
+                         "SELECT title FROM sessions WHERE session_id IN (?, ...)")
+
+        self.assertEqual(lookup.parse_profile_options(['lookup_agenda.py', 'date', '06/17/2018', '--profile']),
+                         (['lookup_agenda.py', 'date', '06/17/2018'], True, constants.SLOW_QUERY_MS, constants.SLOW_QUERY_LOG_NAME))
+        self.assertEqual(lookup.parse_profile_options(['lookup_agenda.py', 'date', '--slow-ms', '2.5', '06/17/2018', '--slow-log', 'date.log']),
+                         (['lookup_agenda.py', 'date', '06/17/2018'], True, 2.5, 'date.log'))
+        self.assertFalse(lookup.parse_profile_options(['lookup_agenda.py', 'date', '06/17/2018'])[1])
+
+        with self.assertRaises(ValueError):
+            lookup.parse_profile_options(['lookup_agenda.py', 'date', '06/17/2018', '--slow-ms', 'fast'])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_filename = os.path.join(temp_dir, "slow_queries.log")
+
+            # nothing was slow enough to be logged yet
+            self.assertEqual(query_profiler.summarize_log(log_filename), [])
+
+            # every statement is slow
+            db_table.profiler = query_profiler.QueryProfiler(0, log_filename)
+
+            try:
+                tables = self.tables
+                for date in ("06/16/2018", "06/17/2018"):
+                    lookup.select_from_sessions_columns({"date": date}, tables)
+                lookup.cached_page([[("date", "06/18/2018")]], 5, None, tables)
+                tables[constants.SESSIONS_TABLE_NAME].select(["title"])
+                report = db_table.profiler.report()
+            finally:
+                db_table.profiler = None
+
+            date_lookups = [row for row in report if row['shape'].startswith("SELECT session_id") and "WHERE date = ?" in row['shape']]
+            self.assertEqual(len(date_lookups), 1)
+            self.assertEqual(date_lookups[0]['count'], 2)
+
+            # the date is indexed, and so are the planned lookups. reading every title is not
+            logged = {row['shape']: row for row in query_profiler.summarize_log(log_filename)}
+            planned_shape = [shape for shape in logged if shape.startswith("WITH hits")][0]
+
+            self.assertEqual(logged[date_lookups[0]['shape']]['full_scans'], [])
+            self.assertEqual(logged[planned_shape]['full_scans'], [])
+            self.assertEqual(len(logged["SELECT title FROM sessions"]['full_scans']), 1)
+
+        print("******* PASSED *******\n")
+
+
+class TestInMemoryAgenda(unittest.TestCase):
+
+    def test_in_memory_import(self):
+        """
+        This tests if an agenda built and looked up in memory is never cached, and if it is saved to disk whole by a backup.
+        """
+
+        print("******* TESTING IN-MEMORY IMPORT *******")
+
+        agenda_database = import_agenda.build_agenda([("agenda.xls", 0)], ":memory:")
+        tables = lookup.connect_tables(agenda_database.sessions.db_conn, ":memory:")
+
+        self.assertEqual(len(lookup.cached_lookup({"speaker": "Yuanyuan Zhou"}, tables)), 2)
+        self.assertEqual(len(lookup.cached_lookup({"date": "06/17/2018"}, tables)), 30)
+        self.assertEqual(lookup.query_cache.get_import_id(":memory:"), None)
+
+        self.assertEqual(lookup.suggest("speaker", "zho", 1, tables), [("Yuanyuan Zhou", 2)])
+        self.assertEqual([(row['resource'], row['session_id'], row['other_session_id']) for row in lookup.find_conflicts(("room",), tables)],
+                         [("Coral 2", 25, 32)])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            database_filename = os.path.join(temp_dir, "backup.db")
+            agenda_database.backup(database_filename)
+
+            backup_tables = lookup.connect_tables(db_name=database_filename)
+
+            self.assertEqual(lookup.get_import_generation(database_filename), 1)
+            self.assertEqual(lookup.cached_lookup({"speaker": "Yuanyuan Zhou"}, backup_tables),
+                             lookup.cached_lookup({"speaker": "Yuanyuan Zhou"}, tables))
+
+            backup_tables[constants.SESSIONS_TABLE_NAME].close()
+
+        agenda_database.close()
+
+        print("******* PASSED *******\n")
+
+
+@unittest.skipUnless(agenda_analytics, "numpy is not installed")
+class TestAgendaAnalytics(ImportedAgenda, unittest.TestCase):
+
+    def test_columnar_export(self):
+        """
+        This tests if the aggregates computed on the exported arrays match the ones computed from the tables.
+        """
+
+        print("******* TESTING COLUMNAR ANALYTICS *******")
+
+        sessions = self.tables[constants.SESSIONS_TABLE_NAME]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            agenda_analytics.export_columns(sessions, temp_dir)
+            columns = agenda_analytics.load_columns(temp_dir)
+
+            speakers, loads, distribution = agenda_analytics.speaker_load(columns)
+            speaker_loads = sessions.select_query("SELECT sp.speaker_name, COUNT(*) AS num_sessions FROM speakers AS sp "
+                                                  "JOIN sessions_speakers AS ss ON ss.speaker_id = sp.speaker_id GROUP BY sp.speaker_name")
+            self.assertEqual(dict(zip(speakers.tolist(), loads.tolist())), {row['speaker_name']: row['num_sessions'] for row in speaker_loads})
+
+            session_ids, fanout, distribution = agenda_analytics.subsession_fanout(columns)
+            self.assertEqual(dict(zip(session_ids.tolist(), fanout.tolist()))[23], 4)
+            self.assertEqual(int(fanout.sum()), len(sessions.select_query("SELECT session_id FROM sessions WHERE typeof(parent_session_id) = 'integer'")))
+
+            rooms, counts = agenda_analytics.sessions_per_room_hour(columns)
+            room_counts = dict(zip(rooms.tolist(), counts.tolist()))
+
+            # breakfast, 07:30 AM to 08:30 AM, every day
+            self.assertEqual(room_counts["Coral Lounge"][7], 3)
+            self.assertEqual(room_counts["Coral Lounge"][8], 3)
+            self.assertNotIn("", room_counts)
+
+        # a 10:00 AM session without a valid end time or date is left out instead of running until midnight
+        columns = {
+            'sessions.location': np.array([0, 0, 0], dtype=np.int32),
+            'sessions.location.values': np.array(["Room 201"]),
+            'sessions.day': np.array([736861, 736861, -1], dtype=np.int32),
+            'sessions.start_minute': np.array([600, 600, 600], dtype=np.int16),
+            'sessions.end_minute': np.array([660, -1, 660], dtype=np.int16)
+        }
+        rooms, counts = agenda_analytics.sessions_per_room_hour(columns)
+        self.assertEqual(counts[0].tolist(), [0] * 10 + [1] + [0] * 13)
+
+        print("******* PASSED *******\n")
+
+
+class TestAsyncLookupAgenda(ImportedAgenda, unittest.IsolatedAsyncioTestCase):
+
+    async def test_lookup_many(self):
+        """
+        This tests if concurrent async lookups return the same rows as the blocking lookups
+        """
+
+        print("******* TESTING ASYNC LOOKUPS *******")
+
+        queries = [("speaker", "Shan Lu"), ("date", "06/17/2018"), ("location", "Coral 2"), ("title", "Software Demo")]
+
+        expected_results = [
+            lookup.select_from_speakers_column({"speaker_name": "Shan Lu"}, self.tables),
+            lookup.select_from_sessions_columns({"date": "06/17/2018"}, self.tables),
+            lookup.select_from_sessions_columns({"location": "Coral 2"}, self.tables),
+            []
+        ]
+
+        async with async_lookup.AsyncAgendaLookup(max_workers=2, db_name=self.database_filename) as agenda:
+            results = await agenda.lookup_many(queries)
+
+            self.assertEqual(results, expected_results)
+            self.assertEqual([len(result) for result in results], [4, 30, 3, 0])
+
+            with self.assertRaises(ValueError):
+                await agenda.lookup("room", "Coral 2")
+
+        print("******* PASSED *******\n")
+
+    async def test_lookup_timeout(self):
+        """
+        This tests if a lookup that times out is aborted and frees its worker for the next lookup
+        """
+
+        print("******* TESTING ASYNC LOOKUP TIMEOUT *******")
+
+        def endless_lookup(lookup_dict, tables):
+            endless_query = "WITH RECURSIVE counter(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM counter) SELECT count(*) FROM counter"
+            tables[constants.SESSIONS_TABLE_NAME].db_conn.execute(endless_query).fetchall()
+
+        async with async_lookup.AsyncAgendaLookup(max_workers=1, db_name=self.database_filename) as agenda:
+            with mock.patch.object(lookup, "cached_lookup", endless_lookup):
+                with self.assertRaises(asyncio.TimeoutError):
+                    await agenda.lookup("location", "Coral 2", timeout=0.2)
+
+            # the single worker is available again once the endless query was interrupted
+            result = await agenda.lookup("speaker", "Shan Lu", timeout=5)
+            self.assertEqual(len(result), 4)
+
+        print("******* PASSED *******\n")
+
+    async def test_lookup_after_reimport(self):
+        """
+        This tests if an open facade answers from the new database once the agenda is re-imported
+        """
+
+        print("******* TESTING ASYNC LOOKUP AFTER RE-IMPORT *******")
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            database_filename = os.path.join(temp_dir, "agenda.db")
+            import_agenda.build_agenda([("agenda.xls", 0)], database_filename).close()
+
+            async with async_lookup.AsyncAgendaLookup(max_workers=1, db_name=database_filename) as agenda:
+                self.assertEqual(len(await agenda.lookup("location", "Coral Lounge")), 7)
+
+                # a normal import replaces the database file, here without the Coral Lounge sessions. The deleted
+                # file takes its generation with it, so the new import starts over at the same generation
+                os.remove(database_filename)
+                reimported = import_agenda.build_agenda([("agenda.xls", 0)], database_filename)
+                reimported.sessions.db_conn.execute("DELETE FROM %s WHERE location = ?" % constants.SESSIONS_TABLE_NAME, ["Coral Lounge"])
+                reimported.sessions.db_conn.commit()
+                reimported.close()
+
+                self.assertEqual(await agenda.lookup("location", "Coral Lounge"), [])
+                fresh_tables = lookup.connect_tables(db_name=database_filename)
+                self.assertEqual(lookup.cached_lookup({"location": "Coral Lounge"}, fresh_tables), [])
+                fresh_tables[constants.SESSIONS_TABLE_NAME].db_conn.close()
+
+        print("******* PASSED *******\n")
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file